@@ -0,0 +1,31 @@
+"""add sensor_data seq_no
+
+Revision ID: 5d1f3c7a9e42
+Revises: bb8920cec60e
+Create Date: 2026-10-17 09:12:31.204518
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d1f3c7a9e42'
+down_revision: Union[str, None] = 'bb8920cec60e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # batch mode recreates the table on SQLite, which cannot add constraints in place
+    with op.batch_alter_table('sensor_data') as batch_op:
+        batch_op.add_column(sa.Column('seq_no', sa.Integer(), nullable=True))
+        batch_op.create_unique_constraint('uq_sensor_data_device_seq', ['device_id', 'seq_no'])
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('sensor_data') as batch_op:
+        batch_op.drop_constraint('uq_sensor_data_device_seq', type_='unique')
+        batch_op.drop_column('seq_no')
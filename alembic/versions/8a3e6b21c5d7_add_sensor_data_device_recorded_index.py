@@ -0,0 +1,30 @@
+"""add sensor_data device_id, recorded_at index
+
+Revision ID: 8a3e6b21c5d7
+Revises: 5d1f3c7a9e42
+Create Date: 2026-10-17 11:40:08.317265
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8a3e6b21c5d7'
+down_revision: Union[str, None] = '5d1f3c7a9e42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # INCLUDE makes the index covering on PostgreSQL and is ignored elsewhere
+    op.create_index(
+        'ix_sensor_data_device_recorded', 'sensor_data', ['device_id', 'recorded_at', 'data_id'],
+        unique=False, postgresql_include=['mq5_level', 'motion_status', 'temperature', 'humidity'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sensor_data_device_recorded', table_name='sensor_data')
@@ -0,0 +1,58 @@
+"""add sensor_rollup
+
+Revision ID: c4f2d9e8a1b6
+Revises: 8a3e6b21c5d7
+Create Date: 2026-10-17 13:05:44.902113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4f2d9e8a1b6'
+down_revision: Union[str, None] = '8a3e6b21c5d7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    columns = []
+    for field in ('mq5_level', 'temperature', 'humidity'):
+        columns += [
+            sa.Column(f'{field}_count', sa.Integer(), nullable=False),
+            sa.Column(f'{field}_sum', sa.Float(), nullable=False),
+            sa.Column(f'{field}_min', sa.Float(), nullable=True),
+            sa.Column(f'{field}_max', sa.Float(), nullable=True),
+        ]
+    op.create_table('sensor_rollup',
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.Column('resolution', sa.Integer(), nullable=False),
+    sa.Column('bucket_start', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('motion_count', sa.Integer(), nullable=False),
+    *columns,
+    sa.ForeignKeyConstraint(['device_id'], ['device.device_id'], ),
+    sa.PrimaryKeyConstraint('device_id', 'resolution', 'bucket_start')
+    )
+    # Roll up the existing readings, the same way rollups.rebuild does, so older ranges are not empty
+    if op.get_bind().dialect.name == 'sqlite':
+        seconds = "CAST(strftime('%s', recorded_at) AS INTEGER)"
+    else:
+        seconds = 'CAST(floor(extract(epoch FROM recorded_at)) AS INTEGER)'
+    fields = ('mq5_level', 'temperature', 'humidity')
+    names = ', '.join(f'{field}_count, {field}_sum, {field}_min, {field}_max' for field in fields)
+    values = ', '.join(f'count({field}), coalesce(sum({field}), 0.0), min({field}), max({field})' for field in fields)
+    for resolution in (60, 3600, 86400):
+        op.execute(
+            f'INSERT INTO sensor_rollup (device_id, resolution, bucket_start, count, motion_count, {names}) '
+            f'SELECT device_id, {resolution}, {seconds} / {resolution} * {resolution}, count(*), '
+            f'sum(CASE WHEN motion_status > 0 THEN 1 ELSE 0 END), {values} '
+            f'FROM sensor_data GROUP BY device_id, {seconds} / {resolution} * {resolution}'
+        )
+
+
+def downgrade() -> None:
+    op.drop_table('sensor_rollup')
@@ -0,0 +1,42 @@
+"""add sensor_data boot_id
+
+Revision ID: cb8ee6356e30
+Revises: e7b5a3c1f9d2
+Create Date: 2026-10-18 09:12:51.407733
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'cb8ee6356e30'
+down_revision: Union[str, None] = 'e7b5a3c1f9d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _sensor_tables():
+    # sensor_data and any monthly partitions, which carry the same constraint
+    names = sa.inspect(op.get_bind()).get_table_names()
+    return [name for name in names if name == 'sensor_data' or re.match(r'^sensor_data_\d{4}_\d{2}$', name)]
+
+
+def upgrade() -> None:
+    # seq_no is now unique per boot, so a device that restarts its counter is not dropped as a duplicate
+    for name in _sensor_tables():
+        with op.batch_alter_table(name) as batch_op:
+            batch_op.add_column(sa.Column('boot_id', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.drop_constraint(f'uq_{name}_device_seq', type_='unique')
+            batch_op.create_unique_constraint(f'uq_{name}_device_boot_seq', ['device_id', 'boot_id', 'seq_no'])
+
+
+def downgrade() -> None:
+    for name in _sensor_tables():
+        with op.batch_alter_table(name) as batch_op:
+            batch_op.drop_constraint(f'uq_{name}_device_boot_seq', type_='unique')
+            batch_op.create_unique_constraint(f'uq_{name}_device_seq', ['device_id', 'seq_no'])
+            batch_op.drop_column('boot_id')
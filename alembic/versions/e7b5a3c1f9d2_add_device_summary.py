@@ -0,0 +1,38 @@
+"""add device_summary
+
+Revision ID: e7b5a3c1f9d2
+Revises: c4f2d9e8a1b6
+Create Date: 2026-10-17 15:21:37.640129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b5a3c1f9d2'
+down_revision: Union[str, None] = 'c4f2d9e8a1b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('device_summary',
+    sa.Column('device_id', sa.Uuid(), nullable=False),
+    sa.Column('reading_count', sa.Integer(), nullable=False),
+    sa.Column('first_recorded_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_recorded_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['device_id'], ['device.device_id'], ),
+    sa.PrimaryKeyConstraint('device_id')
+    )
+    # Populate it from the existing readings
+    op.execute(
+        'INSERT INTO device_summary (device_id, reading_count, first_recorded_at, last_recorded_at) '
+        'SELECT device_id, count(*), min(recorded_at), max(recorded_at) FROM sensor_data GROUP BY device_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('device_summary')
@@ -2,9 +2,38 @@ from typing import Optional
 from fastapi import FastAPI
 import threading
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 from src.routers import user_auth, sensordata, websocket,device
+from src.services.ingest import ingest_buffer
+from src.services.latest import latest_readings
+from src.services.retention import retention_job
+from src.services.database import sessionmanager
+from src.services.shards import sensor_shards
+from src.utils.config import settings
+from src import crud
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Sensor shards get their tables on first start, like the monthly partitions
+    if sensor_shards.enabled:
+        await sensor_shards.create_all()
+        await sensor_shards.warn_unmigrated()
+    # Warm the latest-reading cache from every shard before serving /sensor/latest
+    latest_readings.clear()
+    async with sessionmanager.session() as db:
+        await sensor_shards.gather(db, lambda shard_db, _: latest_readings.load(shard_db, clear=False))
+    # Start the write-behind ingest buffer and drain it fully on shutdown
+    if settings.INGEST_BUFFER_ENABLED:
+        await ingest_buffer.start(crud.sensordata.flush_sensor_rows)
+    # Purge expired readings in the background when a retention is configured
+    if retention_job.enabled:
+        await retention_job.start()
+    yield
+    await retention_job.stop()
+    await ingest_buffer.stop()
+    await sensor_shards.close()
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 origins = ["*"]  # Allow all origins; adjust for production
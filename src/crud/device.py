@@ -1,6 +1,12 @@
 from src.utils.commonImports import *
 from src.models import model
 from src.schemas import schemas
+from src.services.latest import latest_readings
+from src.services.devices import known_devices
+from src.services import rollups
+from src.services.partitions import sensor_partitions
+from src.services.shards import sensor_shards
+from sqlalchemy import union_all
 from src import crud
 
 async def create_device_entry(
@@ -37,12 +43,81 @@ async def get_user_devices(
     db: AsyncSession,
     user_id: UUID
     ) -> List[model.Device]:
+    # DeviceOut has no readings, so the sensor_data collection is not loaded
     result = await db.execute(select(model.Device)
-                    .where(model.Device.owner_id == user_id)
-                    .options(selectinload(model.Device.sensor_data)))
+                    .where(model.Device.owner_id == user_id))
     devices = result.scalars().all()
     return devices
 
+# 1b. Retrieve a user's devices with their reading count, first and last reading time and current values
+async def get_user_device_summaries(
+    db: AsyncSession,
+    user_id: UUID
+    ) -> List[schemas.DeviceSummaryOut]:
+    result = await db.execute(select(model.Device).where(model.Device.owner_id == user_id))
+    devices = result.scalars().all()
+
+    # Counted where the readings live, on every shard at once when sharding is on
+    counts: Dict[UUID, tuple] = {}
+    if devices:
+        for shard_counts in await sensor_shards.gather(db, _reading_counts, [device.device_id for device in devices]):
+            counts.update(shard_counts)
+
+    summaries = []
+    for device in devices:
+        reading_count, first_recorded_at, last_recorded_at = counts.get(device.device_id, (0, None, None))
+        latest = latest_readings.get(device.device_id) or {}
+        latest.pop("recorded_at", None)
+        summaries.append(schemas.DeviceSummaryOut(
+            **schemas.DeviceOut.model_validate(device).model_dump(),
+            reading_count=reading_count or 0,
+            first_recorded_at=first_recorded_at,
+            last_recorded_at=last_recorded_at,
+            **latest,
+        ))
+    return summaries
+
+async def _reading_counts(db: AsyncSession, device_ids: List[UUID]) -> Dict[UUID, tuple]:
+    if rollups.supported(db):
+        # Maintained on ingest, so this is one row per device
+        query = (
+            select(
+                model.DeviceSummary.device_id,
+                model.DeviceSummary.reading_count,
+                model.DeviceSummary.first_recorded_at,
+                model.DeviceSummary.last_recorded_at,
+            )
+            .where(model.DeviceSummary.device_id.in_(device_ids))
+        )
+    else:
+        # Aggregated per partition, then combined for devices with readings in several
+        parts = [
+            select(
+                data.device_id,
+                func.count().label("reading_count"),
+                func.min(data.recorded_at).label("first_recorded_at"),
+                func.max(data.recorded_at).label("last_recorded_at"),
+            )
+            .where(data.device_id.in_(device_ids))
+            .group_by(data.device_id)
+            for data in await sensor_partitions.sources(db)
+        ]
+        if not parts:
+            # Partitioned and no readings stored yet
+            return {}
+        combined = union_all(*parts).subquery()
+        query = (
+            select(
+                combined.c.device_id,
+                func.sum(combined.c.reading_count),
+                func.min(combined.c.first_recorded_at),
+                func.max(combined.c.last_recorded_at),
+            )
+            .group_by(combined.c.device_id)
+        )
+    result = await db.execute(query)
+    return {device_id: tuple(values) for device_id, *values in result.all()}
+
 # 2. Update device information
 async def update_device(
     db: AsyncSession,
@@ -77,22 +152,40 @@ async def delete_device(
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
 
+    async with sensor_shards.session(db, device_id) as shard_db:
+        await rollups.delete_device(shard_db, device_id)
+        await sensor_partitions.delete_device(shard_db, device_id)
+        if shard_db is not db:
+            # The relationship cascade below only reaches the primary database
+            await shard_db.execute(delete(model.SensorData).where(model.SensorData.device_id == device_id))
+            await shard_db.commit()
     await db.delete(device)
     await db.commit()
+    latest_readings.forget(device_id)
+    known_devices.forget(device_id)
 
-# 4. Retrieve a device by its device_id
+# 4. Retrieve a device by its device_id with a bounded page of its readings
 async def get_device_by_id(
     db: AsyncSession,
     device_id: UUID, 
-    user_id: UUID) -> model.Device:
+    user_id: UUID,
+    limit: Optional[int] = None,
+    since: Optional[datetime] = None) -> schemas.DeviceWithSensorData:
     result = await db.execute(
         select(model.Device)
         .where(model.Device.device_id == device_id, model.Device.owner_id == user_id)
-        .options(selectinload(model.Device.sensor_data))
     )
     device = result.scalar_one_or_none()
 
     if not device:
         raise HTTPException(status_code=404, detail="Device not found")
-    
-    return device
\ No newline at end of file
+
+    # The newest readings by default, or the readings since a timestamp in time order
+    page = await crud.sensordata.get_sensor_data_by_device_id(
+        db, device_id, start=since, limit=limit, descending=since is None
+    )
+    return schemas.DeviceWithSensorData(
+        **schemas.DeviceOut.model_validate(device).model_dump(),
+        sensor_data=page.items,
+        next_cursor=page.next_cursor,
+    )
@@ -1,35 +1,309 @@
 from src.utils.commonImports import *
 from src.models import model
 from src.schemas import schemas
+from src.services.database import sessionmanager
+from src.services.ingest import ingest_buffer
+from src.services.devices import known_devices as device_cache
+from src.services.dedup import recent_readings
+from src.services.ratelimit import device_rate_limiter, rate_limit_exceeded
+from src.services import rollups
+from src.services.latest import latest_readings
+from src.services.recent import recent_store, MOTION_MISSING
+from src.services.partitions import sensor_partitions, table_of
+from src.services.shards import ShardWriteError, sensor_shards, by_device
+from src.services.retention import retention_job
+from collections import Counter
+import base64
+from src.utils.config import settings
+import numpy as np
+from src.utils.downsample import lttb
+from sqlalchemy import Integer, case, tuple_, update
+from sqlalchemy.dialects import postgresql, sqlite
 from src import crud
 
+def _utc_naive(value: Optional[datetime]) -> datetime:
+    # Timestamps are stored as naive UTC, matching the datetime.utcnow column defaults
+    if value is None:
+        return datetime.utcnow()
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _sensor_row(sensor_data: schemas.SensorDataCreate) -> dict:
+    # Build the insert parameters for a single reading. A client reading id is
+    # used as the primary key so that retries of the same reading collide.
+    now = datetime.utcnow()
+    boot_id = sensor_data.boot_id or 0
+    return {
+        "data_id": sensor_data.reading_id or uuid4(),
+        "device_id": sensor_data.device_id,
+        "seq_no": sensor_data.seq_no,
+        "boot_id": boot_id,
+        "mq5_level": sensor_data.mq5_level,
+        "motion_status": sensor_data.motion_status,
+        "temperature": sensor_data.temperature,
+        "humidity": sensor_data.humidity,
+        "recorded_at": _utc_naive(sensor_data.recorded_at),
+        "updated_at": now,
+        # Not a column; ignored by the insert and used for the recent-id window
+        "_dedup_key": recent_readings.key(sensor_data.seq_no, sensor_data.reading_id, boot_id),
+    }
+
+def _is_duplicate(row: dict) -> bool:
+    return row["_dedup_key"] is not None and recent_readings.seen(row["device_id"], row["_dedup_key"])
+
+SENSOR_COLUMNS = tuple(model.SensorData.__table__.columns.keys())
+
+def _column_values(row: dict) -> dict:
+    return {column: row[column] for column in SENSOR_COLUMNS}
+
+def _insert_ignoring_duplicates(db: AsyncSession, table):
+    # Readings that hit the primary key or the (device_id, boot_id, seq_no) constraint are skipped,
+    # and RETURNING tells which rows were actually inserted
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(table).on_conflict_do_nothing().returning(table.c.data_id)
+    if dialect == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing().returning(table.c.data_id)
+    # Elsewhere a duplicate fails the whole write, so every row of a successful write is inserted
+    return insert(table)
+
+# Write already-built rows and commit them as one transaction per database; returns the rows inserted
+async def store_sensor_rows(db: AsyncSession, rows: List[dict]) -> List[dict]:
+    if not sensor_shards.enabled:
+        return await _write_rows(db, rows)
+
+    # Every shard writes and commits its own devices' rows, all shards at once
+    grouped: Dict[UUID, List[dict]] = {}
+    for row in rows:
+        grouped.setdefault(row["device_id"], []).append(row)
+
+    async def write_shard(shard_db: AsyncSession, device_ids: List[UUID]):
+        try:
+            return await _write_rows(shard_db, [row for device_id in device_ids for row in grouped[device_id]]), None
+        except SQLAlchemyError as e:
+            return [], (device_ids, e)
+
+    results = await sensor_shards.gather(db, write_shard, list(grouped))
+    failures = [failure for _, failure in results if failure]
+    if failures:
+        # Waits for every shard first, so the error names exactly the readings that were not stored
+        raise ShardWriteError({device_id for device_ids, _ in failures for device_id in device_ids}, failures[0][1])
+    return [row for stored, _ in results for row in stored]
+
+async def _write_rows(db: AsyncSession, rows: List[dict]) -> List[dict]:
+    try:
+        # One prepared INSERT per partition, executed for every row inside a single transaction
+        stored = []
+        for data, part in await sensor_partitions.route(db, rows):
+            table = table_of(data)
+            statement = _insert_ignoring_duplicates(db, table)
+            result = await db.execute(statement, [_column_values(row) for row in part])
+            if result.returns_rows:
+                # Skipped duplicates must not be counted by rollups, caches or the batch result
+                inserted = set(result.scalars().all())
+                stored += [row for row in part if row["data_id"] in inserted]
+            else:
+                stored += part
+        if rollups.supported(db):
+            await rollups.apply_rows(db, stored)
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise
+
+    # Only remember ids once they are durable, so a failed write can be retried
+    for row in rows:
+        if row["_dedup_key"] is not None:
+            recent_readings.add(row["device_id"], row["_dedup_key"])
+    latest_readings.update(stored)
+    recent_store.append(stored)
+    return stored
+
+# Group commit handler used by the ingest buffer
+async def flush_sensor_rows(rows: List[dict]) -> None:
+    async with sessionmanager.session() as db:
+        await store_sensor_rows(db, rows)
+
 # Create sensor data entry
 async def create_sensor_data(
     db: AsyncSession,
     sensor_data: schemas.SensorDataCreate
 ) -> None:  # Change the return type to None
-    # Create a SensorData object and link it to the device
-    new_sensor_data = model.SensorData(**sensor_data.dict())
+    # Checked up front so a buffered reading is not acknowledged and then dropped by the writer
+    if sensor_data.device_id is None:
+        raise HTTPException(status_code=400, detail="device_id is required")
+    if not await device_cache.exists(db, sensor_data.device_id):
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    row = _sensor_row(sensor_data)
+    if _is_duplicate(row):
+        return
+
+    retry_after = await device_rate_limiter.acquire(db, row["device_id"])
+    if retry_after:
+        raise rate_limit_exceeded(retry_after)
+
+    # Hand the reading to the write-behind buffer when it is running; 201 then means queued, not stored
+    if ingest_buffer.running:
+        await ingest_buffer.submit(row)
+        return
+
+    await store_sensor_rows(db, [row])
+
+# Create many sensor data entries in a single transaction, or one per shard when sharding is on
+async def create_sensor_data_batch(
+    db: AsyncSession,
+    items: List[Dict[str, Any]],
+    known_devices: Optional[set] = None,
+    rate_limited: bool = True
+) -> schemas.SensorDataBatchResult:
+    results: List[schemas.SensorDataBatchItemResult] = []
+    candidates: List[Tuple[int, schemas.SensorDataCreate]] = []
+
+    # Validate every item on its own so one bad reading does not reject the batch
+    for index, item in enumerate(items):
+        try:
+            reading = schemas.SensorDataCreate.model_validate(item)
+        except ValidationError as e:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error=str(e.errors()[0]["msg"])))
+            continue
+        if reading.device_id is None:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error="device_id is required"))
+            continue
+        candidates.append((index, reading))
+
+    return await _store_batch(db, candidates, results, known_devices, rate_limited)
 
-    # Add and commit changes to the database
-    db.add(new_sensor_data)
-    await db.commit()
-    await db.refresh(new_sensor_data)
+# Create many sensor data entries that were decoded from a typed format
+async def create_sensor_data_records(
+    db: AsyncSession,
+    readings: List[schemas.SensorDataCreate],
+    known_devices: Optional[set] = None,
+    rate_limited: bool = True
+) -> schemas.SensorDataBatchResult:
+    results: List[schemas.SensorDataBatchItemResult] = []
+    candidates: List[Tuple[int, schemas.SensorDataCreate]] = []
+
+    for index, reading in enumerate(readings):
+        if reading.device_id is None:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error="device_id is required"))
+            continue
+        candidates.append((index, reading))
+
+    return await _store_batch(db, candidates, results, known_devices, rate_limited)
+
+async def _store_batch(
+    db: AsyncSession,
+    candidates: List[Tuple[int, schemas.SensorDataCreate]],
+    results: List[schemas.SensorDataBatchItemResult],
+    known_devices: Optional[set],
+    rate_limited: bool
+) -> schemas.SensorDataBatchResult:
+    # Resolve all referenced devices with at most one query unless the caller already knows them
+    if known_devices is None:
+        known_devices = await device_cache.filter(db, {reading.device_id for _, reading in candidates})
+
+    # Charge each device for all of its readings in the batch at once
+    limited_devices: Dict[UUID, float] = {}
+    if rate_limited and device_rate_limiter.enabled:
+        costs = Counter(reading.device_id for _, reading in candidates if reading.device_id in known_devices)
+        for device_id, cost in costs.items():
+            retry_after = await device_rate_limiter.acquire(db, device_id, cost)
+            if retry_after:
+                limited_devices[device_id] = retry_after
+
+    rows = []
+    pending: List[Tuple[int, schemas.SensorDataCreate, dict]] = []
+    batch_keys = set()
+    duplicates = 0
+    for index, reading in candidates:
+        if reading.device_id not in known_devices:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error="Device not found"))
+            continue
+        if reading.device_id in limited_devices:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error="Rate limit exceeded"))
+            continue
+        row = _sensor_row(reading)
+        # Duplicates are acknowledged as accepted so the client stops retrying them
+        batch_key = (row["device_id"], row["_dedup_key"])
+        if _is_duplicate(row) or (row["_dedup_key"] is not None and batch_key in batch_keys):
+            duplicates += 1
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=True, duplicate=True, data_id=reading.reading_id))
+            continue
+        batch_keys.add(batch_key)
+        rows.append(row)
+        pending.append((index, reading, row))
+
+    # Callers whose whole batch was over the limit get a 429 to back off on
+    if limited_devices and not rows and not duplicates:
+        raise rate_limit_exceeded(min(limited_devices.values()))
+
+    failed_devices = set()
+    inserted = set()
+    if rows:
+        try:
+            inserted = {row["data_id"] for row in await store_sensor_rows(db, rows)}
+        except ShardWriteError as e:
+            # Each shard commits its devices' readings as one unit; only the failed shards' readings are rejected
+            if len(e.device_ids) == len({row["device_id"] for row in rows}):
+                raise e.error
+            failed_devices = e.device_ids
+
+    accepted = duplicates
+    for index, reading, row in pending:
+        if row["device_id"] in failed_devices:
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=False, error="Not stored, retry"))
+            continue
+        accepted += 1
+        if row["data_id"] not in inserted:
+            # Skipped by the database: an older reading already has this reading id or boot_id and seq_no
+            results.append(schemas.SensorDataBatchItemResult(
+                index=index, accepted=True, duplicate=True, data_id=reading.reading_id))
+            continue
+        results.append(schemas.SensorDataBatchItemResult(
+            index=index, accepted=True, data_id=row["data_id"]))
+
+    results.sort(key=lambda r: r.index)
+    return schemas.SensorDataBatchResult(
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        results=results,
+    )
+
+async def _find_sensor_data(db: AsyncSession, data_id: UUID):
+    # Ids carry no time, so every partition is probed by primary key, newest first
+    for data in await sensor_partitions.sources(db, descending=True):
+        record = (await db.execute(select(data).where(data.data_id == data_id))).scalar_one_or_none()
+        if record is not None:
+            return data, record
+    return None, None
+
+async def _on_any_shard(db: AsyncSession, fn):
+    # Ids carry no device either, so with sharding every shard is asked at once
+    results = await sensor_shards.gather(db, lambda shard_db, _: fn(shard_db))
+    return next((result for result in results if result), results[0])
 
 # Get sensor data by its ID
 async def get_sensor_data_by_id(db: AsyncSession, data_id: UUID) -> Optional[schemas.SensorDataWithRelations]:
-    result = await db.execute(
-        select(model.SensorData)
-        .where(model.SensorData.data_id == data_id)
-        .options(selectinload(model.SensorData.device))
-    )
-    sensor_data_record = result.scalar_one_or_none()
+    async def find(shard_db: AsyncSession):
+        return (await _find_sensor_data(shard_db, data_id))[1]
+
+    sensor_data_record = await _on_any_shard(db, find)
 
     if not sensor_data_record:
         return None
 
-    # Convert to Pydantic model
-    device_info = schemas.DeviceOut.model_validate(sensor_data_record.device.__dict__) if sensor_data_record.device else None
+    # Convert to Pydantic model; the device is read from the primary database, which may not hold the reading
+    device = await db.get(model.Device, sensor_data_record.device_id) if sensor_data_record.device_id else None
+    device_info = schemas.DeviceOut.model_validate(device.__dict__) if device else None
     
     return schemas.SensorDataWithRelations.model_validate({
         **sensor_data_record.__dict__,
@@ -37,41 +311,422 @@ async def get_sensor_data_by_id(db: AsyncSession, data_id: UUID) -> Optional[sch
     })
 
 # Get all sensor data recorded by a specific device
-async def get_sensor_data_by_device_id(db: AsyncSession, device_id: UUID) -> List[schemas.SensorDataOut]:
+def encode_cursor(recorded_at: datetime, data_id: UUID) -> str:
+    raw = f"{recorded_at.isoformat()}|{data_id.hex}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        recorded_at, data_id = raw.split("|")
+        return datetime.fromisoformat(recorded_at), UUID(data_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def device_history_query(
+    device_id: UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    after: Optional[Tuple[datetime, UUID]] = None,
+    descending: bool = False,
+    data=model.SensorData
+):
+    query = select(data).where(data.device_id == device_id)
+    if start is not None:
+        query = query.where(data.recorded_at >= _utc_naive(start))
+    if end is not None:
+        query = query.where(data.recorded_at < _utc_naive(end))
+    key = tuple_(data.recorded_at, data.data_id)
+    if after is not None:
+        # Rows strictly past the last row of the previous page; data_id breaks timestamp ties
+        query = query.where(key < tuple_(*after) if descending else key > tuple_(*after))
+    # Matches ix_sensor_data_device_recorded in either direction, so no sort step is needed
+    if descending:
+        return query.order_by(data.recorded_at.desc(), data.data_id.desc())
+    return query.order_by(data.recorded_at, data.data_id)
+
+# Page through a device's readings in recorded_at order, newest first if descending, using a keyset cursor
+@by_device
+async def get_sensor_data_by_device_id(
+    db: AsyncSession,
+    device_id: UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = None,
+    descending: bool = False
+) -> schemas.SensorDataPage:
+    limit = min(limit or settings.SENSOR_PAGE_DEFAULT_SIZE, settings.SENSOR_PAGE_MAX_SIZE)
+
+    after = decode_cursor(cursor) if cursor is not None else None
+    low = _utc_naive(start) if start is not None else None
+    high = _utc_naive(end) if end is not None else None
+    if after is not None and descending:
+        high = min(high or datetime.max, after[0] + timedelta(microseconds=1))
+    elif after is not None:
+        low = max(low or datetime.min, after[0])
+
+    # Fetch one extra row to know whether another page follows. Partitions do not
+    # overlap in time, so later ones are only read while the page is not full.
+    rows = []
+    for data in await sensor_partitions.sources(db, low, high, descending):
+        query = device_history_query(device_id, start, end, after, descending, data)
+        result = await db.execute(query.limit(limit + 1 - len(rows)))
+        rows += result.scalars().all()
+        if len(rows) > limit:
+            break
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].recorded_at, rows[-1].data_id)
+
+    return schemas.SensorDataPage(
+        items=[schemas.SensorDataOut.model_validate(data) for data in rows],
+        next_cursor=next_cursor,
+    )
+
+SERIES_FIELDS = ("mq5_level", "motion_status", "temperature", "humidity")
+
+# Current values of all of a user's devices, served from the latest-reading cache
+async def get_latest_sensor_data(db: AsyncSession, user_id: UUID) -> List[schemas.SensorLatestOut]:
     result = await db.execute(
-        select(model.SensorData)
-        .where(model.SensorData.device_id == device_id)
+        select(model.Device.device_id, model.Device.device_name, model.Device.location)
+        .where(model.Device.owner_id == user_id)
+    )
+    latest = []
+    for device_id, device_name, location in result.all():
+        values = latest_readings.get(device_id) or {}
+        latest.append(schemas.SensorLatestOut(
+            device_id=device_id, device_name=device_name, location=location, **values))
+    return latest
+
+def _series_columns(data):
+    return [data.recorded_at] + [getattr(data, field) for field in SERIES_FIELDS]
+
+def series_seed_query(device_id: UUID, start: datetime, data=model.SensorData):
+    # The last reading before the range seeds the first samples
+    return (
+        select(*_series_columns(data))
+        .where(data.device_id == device_id, data.recorded_at < start)
+        .order_by(data.recorded_at.desc())
+        .limit(1)
+    )
+
+def series_range_query(device_id: UUID, start: datetime, end: datetime, data=model.SensorData):
+    return (
+        select(*_series_columns(data))
+        .where(
+            data.device_id == device_id,
+            data.recorded_at >= start,
+            data.recorded_at <= end,
+        )
+        .order_by(data.recorded_at)
+    )
+
+# Sample a device's readings on a regular grid, forward-filling gaps up to the heartbeat
+@by_device
+async def get_sensor_series(
+    db: AsyncSession,
+    device_id: UUID,
+    start: datetime,
+    end: datetime,
+    interval: int
+) -> schemas.SensorSeriesOut:
+    start, end = _utc_naive(start), _utc_naive(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    if (end - start).total_seconds() / interval > settings.SENSOR_SERIES_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range would return more than {settings.SENSOR_SERIES_MAX_POINTS} samples, increase the interval",
+        )
+    rows = []
+    for data in await sensor_partitions.sources(db, end=start, descending=True):
+        rows = (await db.execute(series_seed_query(device_id, start, data))).all()
+        if rows:
+            break
+    for data in await sensor_partitions.sources(db, start, end + timedelta(microseconds=1)):
+        rows += (await db.execute(series_range_query(device_id, start, end, data))).all()
+
+    grid = np.arange(
+        np.datetime64(start, "us"), np.datetime64(end, "us") + 1, np.timedelta64(interval, "s")
+    )
+    series = {"timestamps": grid.tolist()}
+    if not rows:
+        for field in SERIES_FIELDS:
+            series[field] = [None] * len(grid)
+        return schemas.SensorSeriesOut(device_id=device_id, interval=interval, **series)
+
+    recorded_at = np.array([row[0] for row in rows], dtype="datetime64[us]")
+    # Index of the latest reading at or before every grid point
+    latest = np.searchsorted(recorded_at, grid, side="right") - 1
+    # Devices send at least one reading per heartbeat; older values are missing, not unchanged
+    stale = (latest < 0) | (grid - recorded_at[np.maximum(latest, 0)] > np.timedelta64(settings.SENSOR_HEARTBEAT_SECONDS, "s"))
+
+    for i, field in enumerate(SERIES_FIELDS, start=1):
+        values = np.array([row[i] for row in rows], dtype=object)
+        # Readings may also leave out unchanged fields, which are carried forward from earlier rows
+        present = np.array([value is not None for value in values])
+        last_present = np.maximum.accumulate(np.where(present, np.arange(len(values)), -1))
+        source = last_present[np.maximum(latest, 0)]
+        filled = np.where(stale | (source < 0), None, values[np.maximum(source, 0)])
+        series[field] = filled.tolist()
+
+    return schemas.SensorSeriesOut(device_id=device_id, interval=interval, **series)
+
+AGGREGATE_FIELDS = rollups.ROLLUP_FIELDS
+BUCKET_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "6h": 21600, "1d": 86400}
+
+def _none_for_nan(values: np.ndarray) -> list:
+    # The in-memory columns are float32; round away the conversion noise
+    return [None if np.isnan(value) else value for value in np.round(values.astype(np.float64), 4).tolist()]
+
+def _aggregate_recent(columns: Dict[str, np.ndarray], bucket_seconds: int) -> list:
+    # Same column layout as the SQL aggregate queries, computed over the in-memory window
+    keys = columns["recorded_at"] // (bucket_seconds * 1_000_000)
+    if not len(keys):
+        return [()] * (3 + 3 * len(AGGREGATE_FIELDS))
+    # Rows are in time order, so every bucket is one contiguous run
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    values = [keys[starts] * bucket_seconds, np.diff(np.append(starts, len(keys))).tolist()]
+    for field in AGGREGATE_FIELDS:
+        column = columns[field]
+        present = ~np.isnan(column)
+        counts = np.add.reduceat(present, starts)
+        sums = np.add.reduceat(np.where(present, column, 0).astype(np.float64), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = sums / counts
+        values += [
+            _none_for_nan(np.fmin.reduceat(column, starts)),
+            _none_for_nan(np.fmax.reduceat(column, starts)),
+            _none_for_nan(mean),
+        ]
+    motion = columns["motion_status"]
+    values.append(np.add.reduceat((motion > 0) & (motion != MOTION_MISSING), starts).tolist())
+    return values
+
+# Readings of the recent window straight from the in-memory columns
+@by_device
+async def get_recent_sensor_data(
+    db: AsyncSession,
+    device_id: UUID,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> schemas.SensorRecentOut:
+    start = _utc_naive(start) if start is not None else recent_store.window_start()
+    end = _utc_naive(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    columns = await recent_store.get(db, device_id, start, end)
+    if columns is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Range starts before the recent window, use /sensor/by-device/{device_id} instead",
+        )
+
+    motion = columns["motion_status"]
+    return schemas.SensorRecentOut(
+        device_id=device_id,
+        timestamps=columns["recorded_at"].astype("datetime64[us]").tolist(),
+        mq5_level=_none_for_nan(columns["mq5_level"]),
+        motion_status=[None if value == MOTION_MISSING else value for value in motion.tolist()],
+        temperature=_none_for_nan(columns["temperature"]),
+        humidity=_none_for_nan(columns["humidity"]),
+    )
+
+# Min/max/avg of the readings and a motion count per time bucket, computed by the database
+@by_device
+async def get_sensor_aggregates(
+    db: AsyncSession,
+    device_id: UUID,
+    start: datetime,
+    end: datetime,
+    bucket: str
+) -> schemas.SensorAggregateOut:
+    start, end = _utc_naive(start), _utc_naive(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+    bucket_seconds = BUCKET_SECONDS[bucket]
+    if (end - start).total_seconds() / bucket_seconds > settings.SENSOR_SERIES_MAX_POINTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Range would return more than {settings.SENSOR_SERIES_MAX_POINTS} buckets, use a larger bucket",
+        )
+
+    # Buckets are aligned to the Unix epoch, so daily buckets start at midnight UTC.
+    # The range is widened to whole buckets, which are always returned complete.
+    first = rollups.epoch(start) // bucket_seconds * bucket_seconds
+    last = -(-rollups.epoch(end) // bucket_seconds) * bucket_seconds
+    start, end = datetime.utcfromtimestamp(first), datetime.utcfromtimestamp(last)
+
+    recent = await recent_store.get(db, device_id, start, end)
+    if recent is not None:
+        values = _aggregate_recent(recent, bucket_seconds)
+        return _aggregate_out(device_id, bucket, values)
+
+    if rollups.supported(db):
+        result = await db.execute(rollups.aggregate_query(device_id, bucket_seconds, start, end))
+        rows = result.all()
+    else:
+        # Buckets divide a day and months start at midnight, so no bucket spans two partitions
+        rows = []
+        for data in await sensor_partitions.sources(db, start, end):
+            bucket_start = (rollups.epoch_seconds(db, data.recorded_at) // bucket_seconds * bucket_seconds).label("bucket_start")
+            columns = [bucket_start, func.count()]
+            for field in AGGREGATE_FIELDS:
+                column = getattr(data, field)
+                columns += [func.min(column), func.max(column), func.avg(column)]
+            columns.append(func.sum(case((data.motion_status > 0, 1), else_=0)))
+            result = await db.execute(
+                select(*columns)
+                .where(
+                    data.device_id == device_id,
+                    data.recorded_at >= start,
+                    data.recorded_at < end,
+                )
+                .group_by(bucket_start)
+                .order_by(bucket_start)
+            )
+            rows += result.all()
+    # Transpose the rows into one array per result column
+    values = list(zip(*rows)) if rows else [()] * (3 + 3 * len(AGGREGATE_FIELDS))
+
+    return _aggregate_out(device_id, bucket, values)
+
+def _aggregate_out(device_id: UUID, bucket: str, values: list) -> schemas.SensorAggregateOut:
+    aggregates = {}
+    for i, field in enumerate(AGGREGATE_FIELDS):
+        low, high, mean = values[2 + 3 * i: 5 + 3 * i]
+        aggregates[field] = schemas.SensorFieldAggregates(min=list(low), max=list(high), avg=list(mean))
+
+    return schemas.SensorAggregateOut(
+        device_id=device_id,
+        bucket=bucket,
+        bucket_start=np.array(values[0], dtype="int64").astype("datetime64[s]").tolist(),
+        count=[int(count) for count in values[1]],
+        motion_count=[int(count or 0) for count in values[-1]],
+        **aggregates,
     )
-    device_sensor_data = result.scalars().all()
 
-    # Use model_validate for each entry
-    return [schemas.SensorDataOut.model_validate(data) for data in device_sensor_data]
+# Shape-preserving series of one field with at most `points` points, whatever the range
+@by_device
+async def get_sensor_chart(
+    db: AsyncSession,
+    device_id: UUID,
+    field: str,
+    start: datetime,
+    end: datetime,
+    points: int
+) -> schemas.SensorChartOut:
+    start, end = _utc_naive(start), _utc_naive(end)
+    if end < start:
+        raise HTTPException(status_code=400, detail="'to' must not be before 'from'")
+
+    # The coarsest rollup that still has at least `points` buckets in the range keeps the input small
+    resolution = None
+    if rollups.supported(db):
+        # Only the part of the range that holds readings counts, so a wide range does not collapse to one bucket
+        summary = await db.get(model.DeviceSummary, device_id)
+        span = 0
+        if summary is not None and summary.first_recorded_at is not None:
+            span = (min(end, summary.last_recorded_at) - max(start, summary.first_recorded_at)).total_seconds()
+        resolution = next((r for r in sorted(rollups.ROLLUP_RESOLUTIONS, reverse=True) if span / r >= points), None)
+
+    if resolution is not None:
+        result = await db.execute(rollups.series_query(device_id, field, resolution, start, end))
+        rows = result.all()
+        x = np.array([row[0] for row in rows], dtype=np.float64)
+        y = np.array([row[1] for row in rows], dtype=np.float64)
+    else:
+        recent = await recent_store.get(db, device_id, start, end)
+        if recent is not None:
+            x = recent["recorded_at"] / 1e6
+            y = recent[field].astype(np.float64)
+        else:
+            rows = []
+            for data in await sensor_partitions.sources(db, start, end):
+                result = await db.execute(
+                    select(data.recorded_at, getattr(data, field))
+                    .where(
+                        data.device_id == device_id,
+                        data.recorded_at >= start,
+                        data.recorded_at < end,
+                    )
+                    .order_by(data.recorded_at)
+                )
+                rows += result.all()
+            x = np.array([row[0] for row in rows], dtype="datetime64[us]").astype(np.int64) / 1e6
+            y = np.array([row[1] for row in rows], dtype=np.float64)
+
+    present = ~np.isnan(y)
+    x, y = x[present], y[present]
+    keep = lttb(x, y, points)
+
+    return schemas.SensorChartOut(
+        device_id=device_id,
+        field=field,
+        resolution=resolution,
+        timestamps=(x[keep] * 1e6).astype(np.int64).astype("datetime64[us]").tolist(),
+        values=np.round(y[keep], 4).tolist(),
+    )
+
+def _rollup_values(reading) -> dict:
+    return {
+        name: getattr(reading, name)
+        for name in ("device_id", "recorded_at", "motion_status", *rollups.ROLLUP_FIELDS)
+    }
+
+def _raw_cutoff(device_id: UUID) -> Optional[datetime]:
+    # Rollup buckets older than this may also count readings retention has purged
+    return retention_job.raw_cutoff(datetime.utcnow(), device_id)
 
 # Update sensor data by its ID
 async def update_sensor_data(db: AsyncSession, data_id: UUID, sensor_data: schemas.SensorDataUpdate) -> Optional[schemas.SensorDataOut]:
-    result = await db.execute(select(model.SensorData).where(model.SensorData.data_id == data_id))
-    existing_sensor_data = result.scalar_one_or_none()
+    return await _on_any_shard(db, lambda shard_db: _update_sensor_data(shard_db, data_id, sensor_data))
+
+async def _update_sensor_data(db: AsyncSession, data_id: UUID, sensor_data: schemas.SensorDataUpdate) -> Optional[schemas.SensorDataOut]:
+    data, existing_sensor_data = await _find_sensor_data(db, data_id)
     
     if existing_sensor_data:
-        # Update the fields based on the input data
-        for key, value in sensor_data.dict(exclude_unset=True).items():
-            setattr(existing_sensor_data, key, value)
+        # Update the fields based on the input data, in whichever table holds the reading
+        changes = sensor_data.dict(exclude_unset=True)
+        if changes:
+            table = table_of(data)
+            await db.execute(update(table).where(table.c.data_id == data_id).values(**changes))
 
+        if rollups.supported(db):
+            old = _rollup_values(existing_sensor_data)
+            await rollups.replace_reading(db, old, {**old, **changes}, _raw_cutoff(existing_sensor_data.device_id))
         await db.commit()
-        await db.refresh(existing_sensor_data)
+        result = await db.execute(
+            select(data).where(data.data_id == data_id).execution_options(populate_existing=True)
+        )
+        existing_sensor_data = result.scalar_one()
+        await latest_readings.load(db, [existing_sensor_data.device_id])
+        recent_store.invalidate(existing_sensor_data.device_id)
         return schemas.SensorDataOut.model_validate(existing_sensor_data)
     
     return None
 
 # Delete sensor data by its ID
 async def delete_sensor_data(db: AsyncSession, data_id: UUID) -> bool:
-    result = await db.execute(select(model.SensorData).where(model.SensorData.data_id == data_id))
-    sensor_data_record = result.scalar_one_or_none()
+    return await _on_any_shard(db, lambda shard_db: _delete_sensor_data(shard_db, data_id))
+
+async def _delete_sensor_data(db: AsyncSession, data_id: UUID) -> bool:
+    data, sensor_data_record = await _find_sensor_data(db, data_id)
 
     if sensor_data_record:
         # Delete the sensor data record
-        await db.delete(sensor_data_record)
+        table = table_of(data)
+        await db.execute(delete(table).where(table.c.data_id == data_id))
+        if rollups.supported(db):
+            await rollups.replace_reading(
+                db, _rollup_values(sensor_data_record), None, _raw_cutoff(sensor_data_record.device_id))
+            await rollups.rebuild_summaries(db, sensor_data_record.device_id)
         await db.commit()
+        await latest_readings.load(db, [sensor_data_record.device_id])
+        recent_store.invalidate(sensor_data_record.device_id)
         return True
 
     return False
@@ -3,7 +3,13 @@ from typing import List, Tuple
 import cv2
 import numpy as np
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from src.utils.commonImports import *
+from src.utils import config, sensorcodec
+from src.models import model
 from src.schemas import schemas
+from src.services.database import sessionmanager
+from src.services.devices import known_devices as device_cache
+from src import crud
 
 # initialize the classifier that we will use
 cascade_classifier = cv2.CascadeClassifier()
@@ -43,3 +49,130 @@ async def detect(websocket: WebSocket, queue: asyncio.Queue):
             await websocket.send_json(faces_output.dict())
         else:
             await websocket.send_json({"error": "Invalid image data"})
+
+class SensorStreamDevices:
+    """
+    Devices a stream's user may send readings for.
+
+    The owned devices are looked up again when a message names one that is
+    not among them, so a device registered while the stream is open is
+    accepted, and every message is checked against the known device cache,
+    so readings for a device deleted since are rejected.
+    """
+
+    def __init__(self, owner_id: UUID):
+        self.owner_id = owner_id
+        self.device_ids: set = set()
+
+    def __contains__(self, device_id: UUID) -> bool:
+        return device_id in self.device_ids
+
+    def __len__(self) -> int:
+        return len(self.device_ids)
+
+    async def refresh(self, db: AsyncSession):
+        result = await db.execute(
+            select(model.Device.device_id).where(model.Device.owner_id == self.owner_id)
+        )
+        self.device_ids = set(result.scalars().all())
+
+    async def known(self, db: AsyncSession, referenced: set) -> set:
+        """The subset of `referenced` that exists and is owned by the user."""
+        if referenced - self.device_ids:
+            await self.refresh(db)
+        return await device_cache.filter(db, referenced & self.device_ids)
+
+async def authenticate_sensor_stream(db: AsyncSession, token: str) -> SensorStreamDevices:
+    """
+    Resolves the bearer token of a device stream to an active user and
+    returns the devices that user owns. Raises HTTPException when the token
+    is invalid or the user is inactive.
+    """
+    user = await crud.users.get_current_user(token, db)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Inactive user")
+
+    devices = SensorStreamDevices(user.user_id)
+    await devices.refresh(db)
+    return devices
+
+def _referenced_devices(items: list) -> set:
+    # Ids the items name; invalid ones are reported per item by the batch validation
+    device_ids = set()
+    for item in items:
+        try:
+            device_ids.add(UUID(str(item["device_id"])))
+        except (TypeError, KeyError, ValueError):
+            continue
+    return device_ids
+
+async def _store_stream_batch(websocket: WebSocket, devices: SensorStreamDevices, referenced: set, store):
+    # Every message is stored in a short session of its own, so an idle stream holds no connection.
+    # Rate limiting and database errors are reported on the stream instead of closing it.
+    try:
+        async with sessionmanager.session() as db:
+            result = await store(db, await devices.known(db, referenced))
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail, "retry_after": int((e.headers or {}).get("Retry-After", 1))})
+        return
+    except SQLAlchemyError as e:
+        await websocket.send_json({"error": str(e)})
+        return
+    await websocket.send_json(result.model_dump(mode="json"))
+
+async def stream_sensor_data(
+    websocket: WebSocket,
+    devices: SensorStreamDevices,
+    default_device_id: Optional[UUID] = None
+):
+    """
+    Receives readings from an authenticated device stream until it disconnects.
+    Each text message is a single reading or a JSON array of readings and each
+    binary message is a packed array of sensorcodec records; the whole message
+    is validated and stored as one batch and acknowledged with the per-item
+    results.
+    """
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+
+        if message.get("bytes") is not None:
+            try:
+                readings = sensorcodec.decode_records(message["bytes"])
+            except ValueError as e:
+                await websocket.send_json({"error": str(e)})
+                continue
+            if len(readings) > config.settings.SENSOR_BATCH_MAX_ITEMS:
+                await websocket.send_json({"error": f"Batch exceeds {config.settings.SENSOR_BATCH_MAX_ITEMS} items"})
+                continue
+            if default_device_id is not None:
+                for reading in readings:
+                    if reading.device_id is None:
+                        reading.device_id = default_device_id
+            await _store_stream_batch(
+                websocket, devices,
+                {reading.device_id for reading in readings if reading.device_id is not None},
+                lambda db, known: crud.sensordata.create_sensor_data_records(db, readings, known_devices=known))
+            continue
+
+        try:
+            payload = json.loads(message.get("text") or "")
+        except json.JSONDecodeError:
+            await websocket.send_json({"error": "Invalid JSON"})
+            continue
+
+        items = payload if isinstance(payload, list) else [payload]
+        if len(items) > config.settings.SENSOR_BATCH_MAX_ITEMS:
+            await websocket.send_json({"error": f"Batch exceeds {config.settings.SENSOR_BATCH_MAX_ITEMS} items"})
+            continue
+
+        # Readings may omit device_id when the stream was opened for a single device
+        if default_device_id is not None:
+            for item in items:
+                if isinstance(item, dict) and item.get("device_id") is None:
+                    item["device_id"] = str(default_device_id)
+
+        await _store_stream_batch(
+            websocket, devices, _referenced_devices(items),
+            lambda db, known: crud.sensordata.create_sensor_data_batch(db, items, known_devices=known))
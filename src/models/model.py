@@ -5,7 +5,7 @@ from uuid import UUID, uuid4
 from enum import Enum
 
 # SQLAlchemy specific imports
-from sqlalchemy import String, Boolean,Integer,Float, DateTime, ForeignKey,Table,Column,Index
+from sqlalchemy import String, Boolean,Integer,Float, DateTime, ForeignKey,Table,Column,Index,UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship, declarative_base
 
 
@@ -66,6 +66,11 @@ class SensorData(Base):
     # DHT11 temperature and humidity readings
     temperature: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
     humidity: Mapped[Optional[int]] = mapped_column(Float, nullable=True)
+
+    # Optional per-device sequence number used to de-duplicate retried readings, unique within a boot
+    seq_no: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Device boot or counter epoch; a device that restarts or wraps its seq_no moves to a new boot_id
+    boot_id: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
     
     # Timestamps
     recorded_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow, nullable=False)
@@ -74,6 +79,52 @@ class SensorData(Base):
     # Updated relationship to Device
     device: Mapped["Device"] = relationship("Device", back_populates="sensor_data")
 
+    __table_args__ = (
+        UniqueConstraint("device_id", "boot_id", "seq_no", name="uq_sensor_data_device_boot_seq"),
+        # Per-device history in time order; data_id makes it match the keyset pagination order.
+        # PostgreSQL also stores the readings in the index so range scans skip the table.
+        Index(
+            "ix_sensor_data_device_recorded", "device_id", "recorded_at", "data_id",
+            postgresql_include=["mq5_level", "motion_status", "temperature", "humidity"],
+        ),
+    )
+
+# Pre-aggregated readings per device and time bucket, kept up to date on ingest
+class SensorRollup(Base):
+    __tablename__ = "sensor_rollup"
+
+    device_id: Mapped[UUID] = mapped_column(ForeignKey("device.device_id"), primary_key=True)
+    resolution: Mapped[int] = mapped_column(Integer, primary_key=True)  # bucket size in seconds
+    bucket_start: Mapped[int] = mapped_column(Integer, primary_key=True)  # Unix epoch seconds, aligned to resolution
+
+    count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    motion_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+    # Per field: readings that carried the field, their sum, min and max
+    mq5_level_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    mq5_level_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    mq5_level_min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    mq5_level_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    temperature_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    temperature_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    temperature_min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    temperature_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    humidity_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    humidity_sum: Mapped[float] = mapped_column(Float, nullable=False, default=0.0)
+    humidity_min: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+    humidity_max: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+# All-time totals per device, kept up to date on ingest like the rollups
+class DeviceSummary(Base):
+    __tablename__ = "device_summary"
+
+    device_id: Mapped[UUID] = mapped_column(ForeignKey("device.device_id"), primary_key=True)
+    reading_count: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    first_recorded_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_recorded_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+
 class Device(Base):
     __tablename__ = "device"
     
@@ -1,6 +1,8 @@
 from src.utils.commonImports import *
 from src.utils.commonSession import get_session
 from src.crud.users import get_current_active_user
+from src.utils.config import settings
+from fastapi import Query
 from src.schemas import schemas
 from src.models import model
 from src import crud
@@ -23,6 +25,13 @@ async def retrieve_devices(
     devices = await crud.device.get_user_devices( db,current_user.user_id)
     return devices
 
+@router.get("/get-devices/summary", response_model=List[schemas.DeviceSummaryOut])
+async def retrieve_device_summaries(
+    db: AsyncSession = Depends(get_session),
+    current_user: schemas.UserOut = Depends(get_current_active_user)
+    ):
+    return await crud.device.get_user_device_summaries(db, current_user.user_id)
+
 @router.put("/{device_id}/update-device", response_model=schemas.DeviceOut)
 async def update_device_info(
     device_update: schemas.DeviceUpdate,
@@ -45,8 +54,10 @@ async def delete_device_endpoint(
 @router.get("/{device_id}/get-device-by-id", response_model=schemas.DeviceWithSensorData)
 async def retrieve_device_by_id(
     device_id: UUID,
+    limit: int = Query(settings.SENSOR_PAGE_DEFAULT_SIZE, gt=0, le=settings.SENSOR_PAGE_MAX_SIZE),
+    since: Optional[datetime] = None,
     db: AsyncSession = Depends(get_session),
     current_user: schemas.UserOut = Depends(get_current_active_user)
 ):
-    device = await crud.device.get_device_by_id(db,device_id, current_user.user_id)
+    device = await crud.device.get_device_by_id(db,device_id, current_user.user_id, limit=limit, since=since)
     return device
@@ -1,8 +1,14 @@
 from src.utils.commonImports import *
+from fastapi import Query
 from src.utils.commonSession import get_session
 from src.crud.users import get_current_active_user
 from src.schemas import schemas
 from src.models import model
+from src.utils import config
+from src.services.ingest import IngestBufferFull
+from src.services import backfill, export
+from fastapi.responses import StreamingResponse
+from src.utils import sensorcodec
 from src import crud
 
 router = APIRouter(prefix="/sensor", tags=["Sensor Data"])
@@ -17,10 +23,80 @@ async def create_sensor_data_endpoint(
     try:
         await crud.sensordata.create_sensor_data(db, sensor_data)
         return Response(status_code=status.HTTP_201_CREATED)  # Return empty response with 201 status
+    except IngestBufferFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except HTTPException:
+        raise
     except Exception as e:
         # Handle any exceptions and return a 400 status code if needed
         raise HTTPException(status_code=400, detail=str(e))
-    
+
+
+# Create many sensor data entries in one transaction (one per shard when sharding is on)
+@router.post("/batch", response_model=schemas.SensorDataBatchResult)
+async def create_sensor_data_batch_endpoint(
+    items: List[Dict[str, Any]],
+    db: AsyncSession = Depends(get_session)
+):
+    if len(items) > config.settings.SENSOR_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {config.settings.SENSOR_BATCH_MAX_ITEMS} items",
+        )
+    try:
+        return await crud.sensordata.create_sensor_data_batch(db, items)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Create many sensor data entries from packed binary records
+@router.post("/batch/binary", response_model=schemas.SensorDataBatchResult)
+async def create_sensor_data_binary_endpoint(
+    request: Request,
+    db: AsyncSession = Depends(get_session)
+):
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type not in (sensorcodec.CONTENT_TYPE, "application/octet-stream"):
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Content-Type must be {sensorcodec.CONTENT_TYPE}",
+        )
+    payload = await request.body()
+    if len(payload) > config.settings.SENSOR_BATCH_MAX_ITEMS * sensorcodec.RECORD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {config.settings.SENSOR_BATCH_MAX_ITEMS} items",
+        )
+    try:
+        readings = sensorcodec.decode_records(payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await crud.sensordata.create_sensor_data_records(db, readings)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Stream an NDJSON or CSV backfill of buffered readings
+@router.post("/import", response_model=schemas.SensorImportResult)
+async def import_sensor_data_endpoint(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    db: AsyncSession = Depends(get_session)
+):
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    try:
+        return await backfill.import_readings(db, request.stream(), format)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Current readings of all of the user's devices; declared before /{data_id} so "latest" is not parsed as an id
+@router.get("/latest", response_model=List[schemas.SensorLatestOut])
+async def get_latest_sensor_data_endpoint(
+    db: AsyncSession = Depends(get_session),
+    current_user: schemas.UserOut = Depends(get_current_active_user)
+):
+    return await crud.sensordata.get_latest_sensor_data(db, current_user.user_id)
 
 # Get sensor data by ID, including device information
 @router.get("/{data_id}", response_model=schemas.SensorDataWithRelations)
@@ -35,18 +111,92 @@ async def get_sensor_data_by_id_endpoint(
 
     return sensor_data
 
-# Get all sensor data recorded by a specific device
-@router.get("/by-device/{device_id}", response_model=List[schemas.SensorDataOut])
+# Get a device's sensor data one page at a time, oldest first unless order=desc
+@router.get("/by-device/{device_id}", response_model=schemas.SensorDataPage)
 async def get_sensor_data_by_device_id_endpoint(
     device_id: UUID,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    limit: int = Query(config.settings.SENSOR_PAGE_DEFAULT_SIZE, gt=0, le=config.settings.SENSOR_PAGE_MAX_SIZE),
+    order: Literal["asc", "desc"] = "asc",
     db: AsyncSession = Depends(get_session)
 ):
-    sensor_data_list = await crud.sensordata.get_sensor_data_by_device_id(db, device_id=device_id)
+    # A cursor only continues a listing in the order it was issued for
+    page = await crud.sensordata.get_sensor_data_by_device_id(
+        db, device_id=device_id, start=start, end=end, cursor=cursor, limit=limit, descending=order == "desc"
+    )
 
-    if not sensor_data_list:
+    # An empty later page only means the previous page was the last one
+    if not page.items and cursor is None:
         raise HTTPException(status_code=404, detail="No sensor data found for this device")
 
-    return sensor_data_list
+    return page
+
+# Regular, forward-filled series of a device's readings
+@router.get("/by-device/{device_id}/filled", response_model=schemas.SensorSeriesOut)
+async def get_sensor_series_endpoint(
+    device_id: UUID,
+    start: datetime = Query(alias="from"),
+    end: datetime = Query(alias="to"),
+    interval: int = Query(60, gt=0, description="Seconds between samples"),
+    db: AsyncSession = Depends(get_session)
+):
+    return await crud.sensordata.get_sensor_series(db, device_id, start, end, interval)
+
+# Stream a device's full history as CSV, NDJSON or Parquet
+@router.get("/by-device/{device_id}/export")
+async def export_sensor_data_endpoint(
+    device_id: UUID,
+    format: Literal["csv", "ndjson", "parquet"] = "csv",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_session)
+):
+    if not export.supported(format):
+        raise HTTPException(status_code=400, detail="Parquet export requires the pyarrow package")
+    device = await db.get(model.Device, device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail="Device not found")
+
+    return StreamingResponse(
+        export.export_readings(device_id, format, start, end),
+        media_type=export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="sensor-{device_id}.{format}"'},
+    )
+
+# Readings of the recent window (default the last 24 hours) served from memory
+@router.get("/by-device/{device_id}/recent", response_model=schemas.SensorRecentOut)
+async def get_recent_sensor_data_endpoint(
+    device_id: UUID,
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    db: AsyncSession = Depends(get_session)
+):
+    return await crud.sensordata.get_recent_sensor_data(db, device_id, start, end)
+
+# Downsampled chart series of one field; the payload stays at `points` whatever the range
+@router.get("/by-device/{device_id}/chart", response_model=schemas.SensorChartOut)
+async def get_sensor_chart_endpoint(
+    device_id: UUID,
+    start: datetime = Query(alias="from"),
+    end: datetime = Query(alias="to"),
+    field: Literal["mq5_level", "temperature", "humidity"] = "temperature",
+    points: int = Query(1000, ge=3, le=config.settings.SENSOR_SERIES_MAX_POINTS),
+    db: AsyncSession = Depends(get_session)
+):
+    return await crud.sensordata.get_sensor_chart(db, device_id, field, start, end, points)
+
+# Per-minute, hourly or daily min/max/avg of a device's readings
+@router.get("/by-device/{device_id}/aggregate", response_model=schemas.SensorAggregateOut)
+async def get_sensor_aggregates_endpoint(
+    device_id: UUID,
+    start: datetime = Query(alias="from"),
+    end: datetime = Query(alias="to"),
+    bucket: Literal["1m", "5m", "15m", "1h", "6h", "1d"] = "1h",
+    db: AsyncSession = Depends(get_session)
+):
+    return await crud.sensordata.get_sensor_aggregates(db, device_id, start, end, bucket)
 
 # Update sensor data by ID
 @router.put("/{data_id}", response_model=schemas.SensorDataOut)
@@ -1,6 +1,9 @@
 import asyncio
-from src.crud.websocket import detect, receive, WebSocket, WebSocketDisconnect
+from src.crud.websocket import (
+    detect, receive, authenticate_sensor_stream, stream_sensor_data, WebSocket, WebSocketDisconnect
+)
 from src.utils.commonImports import *
+from src.services.database import sessionmanager
 
 router = APIRouter(prefix="/websocket", tags=["websocket"])
 
@@ -27,3 +30,48 @@ async def face_detection(websocket: WebSocket):
         # Generic error handling for unexpected issues
         print(f"An unexpected error occurred: {e}")
         await websocket.close()
+
+@router.websocket("/sensor-stream")
+async def sensor_stream(
+    websocket: WebSocket,
+    token: Optional[str] = None,
+    device_id: Optional[UUID] = None
+):
+    """
+    Persistent ingest channel for devices. The device authenticates once, with
+    a `token` query parameter, a bearer Authorization header or a first
+    {"token": ...} message, and then pushes readings for as long as the
+    connection stays open.
+    """
+    await websocket.accept()
+
+    if token is None:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+    if token is None:
+        try:
+            token = (await websocket.receive_json()).get("token")
+        except (ValueError, AttributeError):
+            token = None
+
+    try:
+        # The stream opens a session per message, so none is held while it is idle
+        async with sessionmanager.session() as db:
+            devices = await authenticate_sensor_stream(db, token or "")
+    except HTTPException as e:
+        await websocket.send_json({"error": e.detail})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    if device_id is not None and device_id not in devices:
+        await websocket.send_json({"error": "Device not found"})
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    await websocket.send_json({"status": "authenticated", "devices": len(devices)})
+
+    try:
+        await stream_sensor_data(websocket, devices, default_device_id=device_id)
+    except WebSocketDisconnect:
+        print("Sensor stream disconnected.")
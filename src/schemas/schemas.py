@@ -6,7 +6,7 @@ from datetime import datetime
 from typing import List, Optional,Dict,Literal,Tuple
 
 # Third party imports
-from pydantic import BaseModel, ConfigDict, EmailStr
+from pydantic import BaseModel, ConfigDict, EmailStr, Field
 
 class Faces(BaseModel):
     """ This is a pydantic model to define the structure of the streaming data 
@@ -83,14 +83,46 @@ class TokenOut(TokenBase):
 class SensorDataCreate(BaseModel):
     device_id:UUID |None=None
     mq5_level: int | None = None
-    motion_status:int| None = None
+    # 255 is the missing value of the binary record format and the recent readings ring
+    motion_status: int | None = Field(default=None, ge=0, le=254)
     temperature:float | None = None
     humidity:int| None = None
+    recorded_at: datetime | None = None  # Device-side timestamp, defaults to the server time
+    # Idempotency keys: retries carrying the same value are stored only once
+    seq_no: int | None = None  # Per-device sequence number, must not repeat within a boot_id
+    boot_id: int | None = None  # Change it whenever the device restarts or wraps seq_no, defaults to 0
+    reading_id: UUID | None = None  # Client generated id, stored as data_id
+
+# Per-item outcome of a batch ingest request
+class SensorDataBatchItemResult(BaseModel):
+    index: int
+    accepted: bool
+    duplicate: bool = False
+    data_id: UUID | None = None
+    error: str | None = None
+
+# Response for a batch ingest request
+class SensorDataBatchResult(BaseModel):
+    accepted: int
+    rejected: int
+    results: List[SensorDataBatchItemResult]
+
+# Row level error reported by a backfill import
+class SensorImportError(BaseModel):
+    line: int
+    error: str
+
+# Report returned by a backfill import
+class SensorImportResult(BaseModel):
+    rows: int
+    accepted: int
+    rejected: int
+    errors: List[SensorImportError]
 
 # Pydantic schema for updating an existing sensor data entry
 class SensorDataUpdate(BaseModel):
     mq5_level: Optional[float] = None
-    motion_status: Optional[int] = None
+    motion_status: Optional[int] = Field(default=None, ge=0, le=254)
     temperature: Optional[float] = None
     humidity: Optional[float] = None
 
@@ -102,12 +134,74 @@ class SensorDataOut(BaseModel):
     motion_status: Optional[int]
     temperature: Optional[float]
     humidity: Optional[float]
+    seq_no: Optional[int] = None
     recorded_at: datetime
     updated_at: datetime
 
     class Config:
         from_attributes = True
 
+# Current state of a device: the newest value of every field and when the device last reported
+class SensorLatestOut(BaseModel):
+    device_id: UUID
+    device_name: str
+    location: Optional[str] = None
+    recorded_at: Optional[datetime] = None
+    mq5_level: Optional[float] = None
+    motion_status: Optional[int] = None
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+
+# One page of a device's readings; pass next_cursor back to fetch the following page
+class SensorDataPage(BaseModel):
+    items: List[SensorDataOut]
+    next_cursor: Optional[str] = None
+
+# Regular time series of a device, columnar to keep large responses compact
+class SensorSeriesOut(BaseModel):
+    device_id: UUID
+    interval: int  # seconds between samples
+    timestamps: List[datetime]
+    mq5_level: List[Optional[float]]
+    motion_status: List[Optional[int]]
+    temperature: List[Optional[float]]
+    humidity: List[Optional[float]]
+
+# Raw readings of a device's recent window, columnar like SensorSeriesOut
+class SensorRecentOut(BaseModel):
+    device_id: UUID
+    timestamps: List[datetime]
+    mq5_level: List[Optional[float]]
+    motion_status: List[Optional[int]]
+    temperature: List[Optional[float]]
+    humidity: List[Optional[float]]
+
+# Downsampled series of one field for charts
+class SensorChartOut(BaseModel):
+    device_id: UUID
+    field: str
+    resolution: Optional[int] = None  # rollup bucket size in seconds the series was read from, None for raw readings
+    timestamps: List[datetime]
+    values: List[float]
+
+# Per-bucket statistics of one reading field; buckets without a value hold None
+class SensorFieldAggregates(BaseModel):
+    min: List[Optional[float]]
+    max: List[Optional[float]]
+    avg: List[Optional[float]]
+
+# Time-bucketed aggregates of a device's readings, columnar like SensorSeriesOut.
+# Only buckets that contain readings are returned.
+class SensorAggregateOut(BaseModel):
+    device_id: UUID
+    bucket: str
+    bucket_start: List[datetime]
+    count: List[int]
+    mq5_level: SensorFieldAggregates
+    temperature: SensorFieldAggregates
+    humidity: SensorFieldAggregates
+    motion_count: List[int]  # readings in the bucket that reported motion
+
 # Schema for output with related device information
 class SensorDataWithRelations(SensorDataOut):
     device: 'DeviceOut'  # Replace 'DeviceOut' with your actual device schema class if defined elsewhere
@@ -137,7 +231,20 @@ class DeviceOut(BaseModel):
     class Config:
         from_attributes = True
 
+# Device listing entry with summary statistics instead of the reading history
+class DeviceSummaryOut(DeviceOut):
+    reading_count: int = 0
+    first_recorded_at: datetime | None = None
+    last_recorded_at: datetime | None = None
+    # Current values, as served by /sensor/latest
+    mq5_level: Optional[float] = None
+    motion_status: Optional[int] = None
+    temperature: Optional[float] = None
+    humidity: Optional[float] = None
+
 # Schema for output with related sensor data information
 class DeviceWithSensorData(DeviceOut):
     sensor_data: List['SensorDataOut']  # Replace with the actual import if necessary
+    # Continues the readings through /sensor/by-device/{device_id}; order=desc when no 'since' was given
+    next_cursor: Optional[str] = None
     model_config = ConfigDict(from_attributes=True)
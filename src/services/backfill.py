@@ -0,0 +1,174 @@
+# app/services/backfill.py
+"""
+Streaming backfill import of buffered sensor history.
+
+The body is consumed chunk by chunk, split into lines incrementally and
+validated and inserted in chunked transactions, so memory use depends on the
+chunk size and not on the size of the upload.
+
+Usage:
+    python -m src.services.backfill readings.ndjson
+    python -m src.services.backfill readings.csv --chunk-size 2000
+"""
+import argparse
+import codecs
+import csv
+import os
+import sys
+from typing import Callable
+
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.schemas import schemas
+from src import crud
+
+MAX_REPORTED_ERRORS = 100
+
+ProgressCallback = Callable[[schemas.SensorImportResult], None]
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Splits a stream of byte chunks into decoded lines without buffering the
+    whole body. A leading byte order mark is dropped and invalid UTF-8 is
+    replaced with U+FFFD, so a bad byte only spoils its own line.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+async def iter_records(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    """
+    Yields (line number, record) pairs. Records that cannot be parsed are
+    yielded as the exception so they can be reported with their line number.
+    """
+    header = None
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not line.strip():
+            continue
+        if "\ufffd" in line:
+            yield line_no, ValueError("Line is not valid UTF-8")
+            continue
+
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_no, e
+                continue
+            yield line_no, record if isinstance(record, dict) else ValueError("Expected a JSON object")
+            continue
+
+        values = next(csv.reader([line]))
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, ValueError(f"Expected {len(header)} columns, got {len(values)}")
+            continue
+        # Empty CSV cells are treated as missing values
+        yield line_no, {name: value for name, value in zip(header, values) if value != ""}
+
+
+async def import_readings(
+    db: AsyncSession,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    chunk_size: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None
+) -> schemas.SensorImportResult:
+    """
+    Imports NDJSON or CSV readings in chunked transactions and returns a
+    report with the row counts and the first MAX_REPORTED_ERRORS row errors.
+    Every row must carry its original recorded_at timestamp.
+    """
+    if fmt not in ("ndjson", "csv"):
+        raise ValueError(f"Unsupported import format: {fmt}")
+    chunk_size = chunk_size or settings.SENSOR_BATCH_MAX_ITEMS
+
+    report = schemas.SensorImportResult(rows=0, accepted=0, rejected=0, errors=[])
+
+    def reject(line_no: int, error: str):
+        report.rejected += 1
+        if len(report.errors) < MAX_REPORTED_ERRORS:
+            report.errors.append(schemas.SensorImportError(line=line_no, error=error))
+
+    async def flush(pending: List[Tuple[int, dict]]):
+        # Backfills are deliberately bursty, so they bypass the per-device rate limit
+        result = await crud.sensordata.create_sensor_data_batch(
+            db, [record for _, record in pending], rate_limited=False)
+        report.accepted += result.accepted
+        for item in result.results:
+            if not item.accepted:
+                reject(pending[item.index][0], item.error)
+        if progress is not None:
+            progress(report)
+
+    pending: List[Tuple[int, dict]] = []
+    async for line_no, record in iter_records(iter_lines(chunks), fmt):
+        report.rows += 1
+        if isinstance(record, Exception):
+            reject(line_no, str(record))
+            continue
+        if not record.get("recorded_at"):
+            reject(line_no, "recorded_at is required")
+            continue
+        pending.append((line_no, record))
+        if len(pending) >= chunk_size:
+            await flush(pending)
+            pending = []
+
+    if pending:
+        await flush(pending)
+    return report
+
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower()
+    return "csv" if extension == ".csv" else "ndjson"
+
+
+async def _read_file(path: str, chunk_size: int = 1 << 16) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    from src.services.database import sessionmanager
+    from src.services.shards import sensor_shards
+
+    parser = argparse.ArgumentParser(description="Import buffered sensor readings from NDJSON or CSV.")
+    parser.add_argument("path", help="File to import")
+    parser.add_argument("--format", choices=["ndjson", "csv"], help="Defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=settings.SENSOR_BATCH_MAX_ITEMS)
+    args = parser.parse_args(argv)
+
+    def show_progress(report: schemas.SensorImportResult):
+        print(f"{report.rows} rows read, {report.accepted} imported, {report.rejected} rejected", file=sys.stderr)
+
+    async with sessionmanager.session() as db:
+        report = await import_readings(
+            db, _read_file(args.path), args.format or detect_format(args.path),
+            chunk_size=args.chunk_size, progress=show_progress,
+        )
+    await sensor_shards.close()
+    await sessionmanager.close()
+
+    print(report.model_dump_json(indent=2))
+    return 0 if report.rejected == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,71 @@
+# app/services/dedup.py
+from collections import OrderedDict, deque
+from src.utils.commonImports import *
+from src.utils.config import settings
+
+
+class _DeviceWindow:
+    __slots__ = ("order", "keys")
+
+    def __init__(self, size: int):
+        self.order: deque = deque(maxlen=size)
+        self.keys: set = set()
+
+    def add(self, key):
+        if key in self.keys:
+            return
+        if len(self.order) == self.order.maxlen:
+            self.keys.discard(self.order[0])
+        self.order.append(key)
+        self.keys.add(key)
+
+
+class RecentReadingWindow:
+    """
+    Bounded window of the most recently stored reading ids per device.
+
+    Retried readings carry the same device sequence number or client reading
+    id, so most duplicates are rejected here without a database round trip.
+    Anything older than the window is still caught by the unique constraints
+    on sensor_data.
+    """
+
+    def __init__(self):
+        self._devices: "OrderedDict[UUID, _DeviceWindow]" = OrderedDict()
+
+    def init(self, window_size: int, max_devices: int):
+        self._window_size = window_size
+        self._max_devices = max_devices
+
+    @staticmethod
+    def key(seq_no: Optional[int], reading_id: Optional[UUID], boot_id: int = 0):
+        # Readings without a sequence number or client id cannot be de-duplicated
+        if seq_no is not None:
+            return ("seq", boot_id, seq_no)
+        if reading_id is not None:
+            return ("id", reading_id)
+        return None
+
+    def seen(self, device_id: UUID, key) -> bool:
+        window = self._devices.get(device_id)
+        return window is not None and key in window.keys
+
+    def add(self, device_id: UUID, key):
+        window = self._devices.get(device_id)
+        if window is None:
+            window = self._devices[device_id] = _DeviceWindow(self._window_size)
+            if len(self._devices) > self._max_devices:
+                self._devices.popitem(last=False)
+        else:
+            self._devices.move_to_end(device_id)
+        window.add(key)
+
+    def clear(self):
+        self._devices.clear()
+
+
+recent_readings = RecentReadingWindow()
+recent_readings.init(
+    window_size=settings.SENSOR_DEDUP_WINDOW,
+    max_devices=settings.SENSOR_DEDUP_MAX_DEVICES,
+)
@@ -0,0 +1,39 @@
+# app/services/devices.py
+from src.utils.commonImports import *
+from src.models import model
+
+
+class KnownDeviceCache:
+    """
+    Ids of devices known to exist.
+
+    Lets ingest reject readings for unknown devices before they are queued,
+    without a query per reading. Ids that are not cached are looked up, so a
+    device registered after startup is accepted on its first reading, and
+    deleted devices are forgotten by the device crud. Like the other caches
+    it assumes a single API worker.
+    """
+
+    def __init__(self):
+        self._devices: set = set()
+
+    async def filter(self, db: AsyncSession, device_ids) -> set:
+        """The subset of `device_ids` that exist."""
+        device_ids = set(device_ids)
+        missing = device_ids - self._devices
+        if missing:
+            result = await db.execute(select(model.Device.device_id).where(model.Device.device_id.in_(missing)))
+            self._devices.update(result.scalars().all())
+        return device_ids & self._devices
+
+    async def exists(self, db: AsyncSession, device_id: UUID) -> bool:
+        return bool(await self.filter(db, [device_id]))
+
+    def forget(self, device_id: UUID):
+        self._devices.discard(device_id)
+
+    def clear(self):
+        self._devices.clear()
+
+
+known_devices = KnownDeviceCache()
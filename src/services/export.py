@@ -0,0 +1,157 @@
+# app/services/export.py
+"""
+Streaming export of a device's sensor history as CSV, NDJSON or Parquet.
+
+Rows are read in keyset-paginated chunks, each in a short session of its
+own, and every chunk is encoded and handed to the response before the next
+one is fetched, so memory use depends on the chunk size and not on the
+length of the history. Parquet export writes one row group per chunk and
+needs the optional pyarrow package (the Pipfile's "parquet" category,
+installed with `pipenv install --categories parquet`).
+"""
+import csv
+import io
+
+from src.utils.commonImports import *
+from src import crud
+from src.models import model
+from src.services.shards import sensor_shards
+from src.services.partitions import sensor_partitions
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_CHUNK_ROWS = 10000
+EXPORT_COLUMNS = ("data_id", "recorded_at", "seq_no", "mq5_level", "motion_status", "temperature", "humidity")
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    # Stored timestamps are naive UTC
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def supported(fmt: str) -> bool:
+    return fmt != "parquet" or pq is not None
+
+
+async def _iter_chunks(
+    device_id: UUID,
+    start: Optional[datetime],
+    end: Optional[datetime]
+) -> AsyncIterator[list]:
+    # The response outlives the request's session dependency, so the export opens its own on the device's shard.
+    # Every chunk is a keyset page read in a short session of its own: a slow client must not hold a read
+    # transaction open for the whole download, since that would block the writers.
+    manager = sensor_shards.manager(device_id)
+    async with manager.session() as db:
+        sources = await sensor_partitions.sources(db, start, end)
+
+    # Partitions come in time order, so reading them one after another keeps the rows ordered
+    for data in sources:
+        columns = [getattr(data, column) for column in EXPORT_COLUMNS]
+        after = None
+        while True:
+            # The same keyset query as the paginated history API, narrowed to the exported columns
+            query = crud.sensordata.device_history_query(device_id, start, end, after, data=data)
+            async with manager.session() as db:
+                chunk = (await db.execute(query.with_only_columns(*columns).limit(EXPORT_CHUNK_ROWS))).all()
+            if chunk:
+                yield chunk
+            if len(chunk) < EXPORT_CHUNK_ROWS:
+                break
+            after = (chunk[-1].recorded_at, chunk[-1].data_id)
+
+
+async def _csv(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for chunk in chunks:
+        writer.writerows(
+            (row.data_id, row.recorded_at.isoformat(), *row[2:]) for row in chunk
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        lines = []
+        for row in chunk:
+            record = dict(zip(EXPORT_COLUMNS, row))
+            record["data_id"] = str(record["data_id"])
+            record["recorded_at"] = record["recorded_at"].isoformat()
+            lines.append(json.dumps(record))
+        yield ("\n".join(lines) + "\n").encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands out what was written since the last drain."""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # The Parquet writer records absolute offsets in the footer
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts.clear()
+        return data
+
+
+async def _parquet(chunks: AsyncIterator[list]) -> AsyncIterator[bytes]:
+    schema = pa.schema([
+        ("data_id", pa.string()),
+        ("recorded_at", pa.timestamp("us", tz="UTC")),
+        ("seq_no", pa.int64()),
+        ("mq5_level", pa.float64()),
+        ("motion_status", pa.int64()),
+        ("temperature", pa.float64()),
+        ("humidity", pa.float64()),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    try:
+        async for chunk in chunks:
+            columns = list(zip(*chunk))
+            columns[0] = [str(data_id) for data_id in columns[0]]
+            writer.write_batch(pa.record_batch(columns, schema=schema))
+            yield sink.drain()
+    finally:
+        writer.close()
+    yield sink.drain()
+
+
+def export_readings(
+    device_id: UUID,
+    fmt: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> AsyncIterator[bytes]:
+    """Encoded export of the device's readings in [start, end), oldest first."""
+    encoders = {"csv": _csv, "ndjson": _ndjson, "parquet": _parquet}
+    return encoders[fmt](_iter_chunks(device_id, _naive_utc(start), _naive_utc(end)))
@@ -0,0 +1,115 @@
+# app/services/ingest.py
+from src.utils.commonImports import *
+from src.utils.config import settings
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+FlushHandler = Callable[[List[dict]], Awaitable[None]]
+
+
+class IngestBufferFull(Exception):
+    """Raised when a reading cannot be queued before the enqueue timeout."""
+
+
+class IngestBuffer:
+    """
+    Write-behind buffer for sensor readings.
+
+    Readings are queued in memory and written as group commits when either
+    `max_rows` readings are pending or `flush_interval` seconds have passed
+    since the first reading of the current group.
+    """
+
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._handler: Optional[FlushHandler] = None
+        self._accepting = False
+
+    def init(self, max_rows: int, flush_interval: float, max_depth: int, enqueue_timeout: float):
+        self._max_rows = max_rows
+        self._flush_interval = flush_interval
+        self._max_depth = max_depth
+        self._enqueue_timeout = enqueue_timeout
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    async def start(self, handler: FlushHandler):
+        if self._task is not None:
+            raise Exception("Ingest buffer is already running")
+        self._handler = handler
+        self._queue = asyncio.Queue(maxsize=self._max_depth)
+        self._task = asyncio.create_task(self._run())
+        self._accepting = True
+
+    async def stop(self):
+        if self._task is None:
+            return
+        # Stop accepting new readings and wait until everything queued is written
+        self._accepting = False
+        await self._queue.join()
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+        self._queue = None
+
+    async def submit(self, row: dict):
+        if not self._accepting:
+            raise Exception("Ingest buffer is not running")
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            # Backpressure: wait a bounded time for the writer to catch up
+            try:
+                await asyncio.wait_for(self._queue.put(row), self._enqueue_timeout)
+            except asyncio.TimeoutError:
+                raise IngestBufferFull("Ingest queue is full")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self._flush_interval
+            while len(batch) < self._max_rows:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            await self._handler(batch)
+            return
+        except Exception as e:
+            logger.warning(f"Group commit of {len(batch)} readings failed, retrying one by one: {e}")
+
+        # Isolate the bad readings so the rest of the group is not lost
+        for row in batch:
+            try:
+                await self._handler([row])
+            except Exception as e:
+                logger.error(f"Dropping sensor reading {row.get('data_id')}: {e}")
+
+
+ingest_buffer = IngestBuffer()
+ingest_buffer.init(
+    max_rows=settings.INGEST_FLUSH_MAX_ROWS,
+    flush_interval=settings.INGEST_FLUSH_INTERVAL,
+    max_depth=settings.INGEST_MAX_QUEUE_DEPTH,
+    enqueue_timeout=settings.INGEST_ENQUEUE_TIMEOUT,
+)
@@ -0,0 +1,101 @@
+# app/services/latest.py
+from sqlalchemy import and_
+from src.utils.commonImports import *
+from src.models import model
+from src.services.partitions import sensor_partitions
+
+LATEST_FIELDS = ("mq5_level", "motion_status", "temperature", "humidity")
+
+
+class _DeviceLatest:
+    __slots__ = ("recorded_at", "values", "updated")
+
+    def __init__(self):
+        self.recorded_at: Optional[datetime] = None
+        self.values: Dict[str, Any] = {}
+        self.updated: Dict[str, datetime] = {}
+
+
+class LatestReadingCache:
+    """
+    Most recent value of every reading field per device.
+
+    Updated by every stored batch and warmed from sensor_data at startup, so
+    the current state of a user's devices is answered without touching the
+    history. Fields are tracked separately because devices may leave out
+    fields that have not changed. Late or backfilled readings never replace
+    newer values. The cache lives in the process, so it assumes a single
+    API worker, like the ingest buffer.
+    """
+
+    def __init__(self):
+        self._devices: Dict[UUID, _DeviceLatest] = {}
+
+    def update(self, rows: List[dict]):
+        for row in rows:
+            latest = self._devices.get(row["device_id"])
+            if latest is None:
+                latest = self._devices[row["device_id"]] = _DeviceLatest()
+            recorded_at = row["recorded_at"]
+            if recorded_at.tzinfo is not None:
+                # Compare as naive UTC like the timestamps of newly stored rows
+                recorded_at = recorded_at.astimezone(timezone.utc).replace(tzinfo=None)
+            if latest.recorded_at is None or recorded_at >= latest.recorded_at:
+                latest.recorded_at = recorded_at
+            for field in LATEST_FIELDS:
+                value = row.get(field)
+                if value is None:
+                    continue
+                updated = latest.updated.get(field)
+                if updated is None or recorded_at >= updated:
+                    latest.values[field] = value
+                    latest.updated[field] = recorded_at
+
+    def get(self, device_id: UUID) -> Optional[dict]:
+        latest = self._devices.get(device_id)
+        if latest is None:
+            return None
+        return {"recorded_at": latest.recorded_at, **latest.values}
+
+    def forget(self, device_id: UUID):
+        self._devices.pop(device_id, None)
+
+    async def load(self, db: AsyncSession, device_ids: Optional[List[UUID]] = None, clear: bool = True):
+        """
+        Reloads the latest values from sensor_data, for the given devices or all
+        of them. Pass clear=False to add the devices of another sensor shard.
+        """
+        if device_ids is not None:
+            for device_id in device_ids:
+                self.forget(device_id)
+        elif clear:
+            self._devices.clear()
+
+        # One grouped query per field and partition finds the newest reading that carried it;
+        # update() keeps the newest value when a device has readings in several partitions
+        for data in await sensor_partitions.sources(db):
+            for field in (None,) + LATEST_FIELDS:
+                newest = select(data.device_id, func.max(data.recorded_at).label("recorded_at"))
+                if field is not None:
+                    newest = newest.where(getattr(data, field).isnot(None))
+                if device_ids is not None:
+                    newest = newest.where(data.device_id.in_(device_ids))
+                newest = newest.group_by(data.device_id).subquery()
+
+                columns = [data.device_id, data.recorded_at] + ([getattr(data, field)] if field else [])
+                result = await db.execute(
+                    select(*columns).join(
+                        newest, and_(data.device_id == newest.c.device_id, data.recorded_at == newest.c.recorded_at)
+                    )
+                )
+                for row in result.all():
+                    reading = {"device_id": row[0], "recorded_at": row[1]}
+                    if field is not None:
+                        reading[field] = row[2]
+                    self.update([reading])
+
+    def clear(self):
+        self._devices.clear()
+
+
+latest_readings = LatestReadingCache()
@@ -0,0 +1,243 @@
+# app/services/partitions.py
+"""
+Optional monthly partitioning of sensor readings.
+
+With SENSOR_PARTITIONING=monthly, readings are stored in one table per
+calendar month (UTC) named sensor_data_YYYY_MM. Each table has the columns,
+unique constraint and history index of sensor_data, and it is created when
+the first reading for that month arrives. Readers ask `sources` for the
+partitions that overlap their time range and run the same query against
+each one in time order, so a range inside one month touches one table. An
+expired month is removed with a single DROP TABLE instead of a mass DELETE.
+
+Readings stored in sensor_data before partitioning was switched on are not
+read in this mode; move them with `migrate`. The commands below other than
+`list` need SENSOR_PARTITIONING=monthly, like the app.
+
+Usage:
+    python -m src.services.partitions list
+    python -m src.services.partitions migrate                # move sensor_data rows into monthly tables
+    python -m src.services.partitions drop --before 2024-01  # drop every month before January 2024
+"""
+import argparse
+import re
+import sys
+
+from sqlalchemy import Index, Table, UniqueConstraint, inspect
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import aliased
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+
+PARTITION_NAME = re.compile(r"^sensor_data_(\d{4})_(\d{2})$")
+# sensor_data's history index, repeated on every partition
+INDEX_INCLUDE = ["mq5_level", "motion_status", "temperature", "humidity"]
+
+
+def month_start(value: datetime) -> datetime:
+    return datetime(value.year, value.month, 1)
+
+
+def next_month(month: datetime) -> datetime:
+    return datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def partition_name(month: datetime) -> str:
+    return f"sensor_data_{month:%Y_%m}"
+
+
+def table_of(data) -> Table:
+    """The table behind sensor_data or a partition entity returned by `sources`."""
+    return inspect(data).selectable
+
+
+class SensorPartitions:
+    """
+    Monthly sensor_data tables known to exist, with ORM entities to query them.
+
+    Partition entities are aliases of model.SensorData, so they are used
+    like model.SensorData in queries and load SensorData objects, but those
+    objects must be changed with update and delete statements on the
+    partition table rather than through the session. The list of partitions
+    is read from each database once and then kept in the process, like the
+    other caches, so tables should only be created and dropped through this
+    class.
+    """
+
+    def __init__(self):
+        # Engine -> month start -> entity; sensor shards each have their own partitions
+        self._databases: Dict[Any, Dict[datetime, Any]] = {}
+        self._lock = asyncio.Lock()
+
+    def init(self, enabled: bool):
+        self._enabled = enabled
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def entity(self, month: datetime):
+        """The entity of a month's partition, whether or not its table exists yet."""
+        name = partition_name(month)
+        table = model.Base.metadata.tables.get(name)
+        if table is None:
+            table = Table(
+                name, model.Base.metadata,
+                *(column._copy() for column in model.SensorData.__table__.columns),
+                UniqueConstraint("device_id", "boot_id", "seq_no", name=f"uq_{name}_device_boot_seq"),
+                Index(f"ix_{name}_device_recorded", "device_id", "recorded_at", "data_id",
+                      postgresql_include=INDEX_INCLUDE),
+            )
+        return aliased(model.SensorData, table, adapt_on_names=True)
+
+    async def _load(self, db: AsyncSession) -> Dict[datetime, Any]:
+        months = self._databases.get(db.bind)
+        if months is not None:
+            return months
+        months = {}
+        names = await db.run_sync(lambda session: inspect(session.connection()).get_table_names())
+        for name in names:
+            match = PARTITION_NAME.match(name)
+            if match:
+                month = datetime(int(match.group(1)), int(match.group(2)), 1)
+                months[month] = self.entity(month)
+        return self._databases.setdefault(db.bind, months)
+
+    async def months(self, db: AsyncSession) -> List[datetime]:
+        return sorted(await self._load(db))
+
+    async def sources(
+        self,
+        db: AsyncSession,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        descending: bool = False
+    ) -> list:
+        """
+        Entities holding the readings recorded in [start, end) (naive UTC, open
+        when None) in time order. Just model.SensorData when partitioning is off.
+        """
+        if not self._enabled:
+            return [model.SensorData]
+        partitions = await self._load(db)
+        months = [
+            month for month in sorted(partitions)
+            if (start is None or next_month(month) > start) and (end is None or month < end)
+        ]
+        if descending:
+            months.reverse()
+        return [partitions[month] for month in months]
+
+    async def route(self, db: AsyncSession, rows: List[dict]) -> List[Tuple[Any, List[dict]]]:
+        """Groups rows by the entity they are stored in, creating missing partitions."""
+        if not self._enabled:
+            return [(model.SensorData, rows)]
+        partitions = await self._load(db)
+        grouped: Dict[datetime, List[dict]] = {}
+        for row in rows:
+            grouped.setdefault(month_start(row["recorded_at"]), []).append(row)
+
+        missing = [month for month in grouped if month not in partitions]
+        if missing:
+            async with self._lock:
+                for month in missing:
+                    if month in partitions:
+                        continue
+                    entity = self.entity(month)
+                    # Created in its own transaction so the table survives a rollback of the batch
+                    async with db.bind.begin() as conn:
+                        await conn.run_sync(lambda sync_conn: table_of(entity).create(sync_conn, checkfirst=True))
+                    partitions[month] = entity
+        return [(partitions[month], grouped[month]) for month in sorted(grouped)]
+
+    async def delete_device(self, db: AsyncSession, device_id: UUID) -> None:
+        """Deletes a device's readings from every partition. Does not commit."""
+        if not self._enabled:
+            # sensor_data rows go with the device through the relationship cascade
+            return
+        for data in await self.sources(db):
+            table = table_of(data)
+            await db.execute(delete(table).where(table.c.device_id == device_id))
+
+    async def drop(self, db: AsyncSession, month: datetime) -> None:
+        """Drops a month's partition. The caller keeps summaries and caches in step."""
+        partitions = await self._load(db)
+        async with self._lock:
+            entity = partitions.pop(month, None)
+            if entity is None:
+                return
+            async with db.bind.begin() as conn:
+                await conn.run_sync(lambda sync_conn: table_of(entity).drop(sync_conn, checkfirst=True))
+
+    def clear(self):
+        self._databases.clear()
+
+
+sensor_partitions = SensorPartitions()
+sensor_partitions.init(enabled=settings.SENSOR_PARTITIONING == "monthly")
+
+
+async def migrate(db: AsyncSession, chunk_rows: int) -> int:
+    """Moves readings from sensor_data into their monthly partitions, committing every chunk."""
+    data = model.SensorData
+    moved = 0
+    while True:
+        # Moved rows are deleted, so the next chunk is simply the first rows left
+        result = await db.execute(select(data.__table__).limit(chunk_rows))
+        rows = [dict(row._mapping) for row in result.all()]
+        if not rows:
+            return moved
+        dialect = db.get_bind().dialect.name
+        for entity, part in await sensor_partitions.route(db, rows):
+            table = table_of(entity)
+            if dialect == "postgresql":
+                statement = postgresql.insert(table).on_conflict_do_nothing()
+            else:
+                statement = sqlite.insert(table).on_conflict_do_nothing()
+            await db.execute(statement, part)
+        await db.execute(delete(data).where(data.data_id.in_([row["data_id"] for row in rows])))
+        await db.commit()
+        moved += len(rows)
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    from src.services.database import sessionmanager
+    from src.services.shards import sensor_shards
+
+    parser = argparse.ArgumentParser(description="Maintain monthly sensor_data partitions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the monthly partitions")
+    migrate_parser = commands.add_parser("migrate", help="Move the readings in sensor_data into monthly partitions")
+    migrate_parser.add_argument("--chunk-rows", type=int, default=10000)
+    drop_parser = commands.add_parser("drop", help="Drop whole months of readings")
+    drop_parser.add_argument("--before", required=True, type=lambda value: datetime.strptime(value, "%Y-%m"),
+                             help="First month to keep, YYYY-MM")
+    args = parser.parse_args(argv)
+
+    if args.command != "list" and not sensor_partitions.enabled:
+        print("Partitioning is off, set SENSOR_PARTITIONING=monthly", file=sys.stderr)
+        return 1
+    # The primary database, or every sensor shard when sharding is on
+    for manager in sensor_shards.managers():
+        async with manager.session() as db:
+            if args.command == "list":
+                for month in await sensor_partitions.months(db):
+                    print(partition_name(month))
+            elif args.command == "migrate":
+                print(f"Moved {await migrate(db, args.chunk_rows)} readings")
+            else:
+                from src.services import rollups
+                for month in await sensor_partitions.months(db):
+                    if month < args.before:
+                        await sensor_partitions.drop(db, month)
+                        print(f"Dropped {partition_name(month)}")
+                # Rollups stay; the summaries are recounted from the remaining readings
+                await rollups.rebuild_summaries(db)
+                await db.commit()
+    await sensor_shards.close()
+    await sessionmanager.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,119 @@
+# app/services/ratelimit.py
+import math
+import time
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "rate", "burst")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+        self.rate = rate
+        self.burst = burst
+
+
+class DeviceRateLimiter:
+    """
+    Per-device token bucket limiter for sensor ingest.
+
+    Every device gets `rate` readings per second with bursts of up to `burst`
+    readings. Limits can be overridden per device id or per device model.
+    Buckets that have been idle long enough to refill completely carry no
+    state, so they are evicted and recreated on the next reading.
+    """
+
+    def __init__(self):
+        self._buckets: Dict[UUID, _Bucket] = {}
+        self._next_sweep = 0.0
+
+    def init(self, rate: float, burst: float, overrides: Dict[str, Dict[str, float]], sweep_interval: float = 60.0):
+        self._rate = rate
+        self._burst = burst
+        self._device_overrides = {}
+        self._model_overrides = {}
+        for key, limits in overrides.items():
+            # Keys are device ids or "model:<device model>"
+            if key.startswith("model:"):
+                self._model_overrides[key[len("model:"):]] = limits
+            else:
+                self._device_overrides[UUID(key)] = limits
+        self._sweep_interval = sweep_interval
+
+    @property
+    def enabled(self) -> bool:
+        return self._rate > 0
+
+    async def _limits_for(self, db: AsyncSession, device_id: UUID) -> Tuple[float, float]:
+        limits = self._device_overrides.get(device_id)
+        if limits is None and self._model_overrides:
+            # Only looked up when a bucket is created, not on every reading
+            device_model = await db.scalar(
+                select(model.Device.device_model).where(model.Device.device_id == device_id)
+            )
+            limits = self._model_overrides.get(device_model)
+        if limits is None:
+            return self._rate, self._burst
+        rate = float(limits.get("rate", self._rate))
+        return rate, float(limits.get("burst", self._burst))
+
+    def _sweep(self, now: float):
+        self._next_sweep = now + self._sweep_interval
+        idle = [
+            device_id for device_id, bucket in self._buckets.items()
+            if bucket.rate <= 0 or bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst
+        ]
+        for device_id in idle:
+            del self._buckets[device_id]
+
+    async def acquire(self, db: AsyncSession, device_id: UUID, cost: int = 1) -> float:
+        """
+        Takes `cost` tokens from the device's bucket. Returns 0 when the
+        readings are admitted, otherwise the number of seconds to wait.
+        A cost larger than the burst is admitted from a full bucket and
+        leaves the bucket in debt.
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._sweep(now)
+
+        bucket = self._buckets.get(device_id)
+        if bucket is None:
+            rate, burst = await self._limits_for(db, device_id)
+            bucket = self._buckets[device_id] = _Bucket(rate, burst, now)
+        if bucket.rate <= 0:
+            return 0.0
+
+        bucket.tokens = min(bucket.burst, bucket.tokens + (now - bucket.updated) * bucket.rate)
+        bucket.updated = now
+
+        needed = min(cost, bucket.burst)
+        if bucket.tokens < needed:
+            return (needed - bucket.tokens) / bucket.rate
+        bucket.tokens -= cost
+        return 0.0
+
+    def clear(self):
+        self._buckets.clear()
+
+
+def rate_limit_exceeded(retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Rate limit exceeded",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+device_rate_limiter = DeviceRateLimiter()
+device_rate_limiter.init(
+    rate=settings.SENSOR_RATE_LIMIT,
+    burst=settings.SENSOR_RATE_BURST,
+    overrides=json.loads(settings.SENSOR_RATE_LIMIT_OVERRIDES or "{}"),
+)
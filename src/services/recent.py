@@ -0,0 +1,252 @@
+# app/services/recent.py
+from collections import OrderedDict
+import numpy as np
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+from src.services.partitions import sensor_partitions
+
+# Column name -> dtype. Missing floats are NaN and missing motion is MOTION_MISSING.
+RECENT_COLUMNS = {
+    "recorded_at": np.int64,  # microseconds since the Unix epoch, UTC
+    "mq5_level": np.float32,
+    "temperature": np.float32,
+    "humidity": np.float32,
+    "motion_status": np.uint8,
+}
+MOTION_MISSING = 255
+# Ranges may start a little before the window: "the last 24 hours" computed by the
+# client, or widened to whole hourly buckets. The ring is then hydrated from that start.
+WINDOW_SLACK = timedelta(hours=1)
+ROW_BYTES = sum(np.dtype(dtype).itemsize for dtype in RECENT_COLUMNS.values())
+
+
+def _naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def to_micros(value: datetime) -> int:
+    return int(np.datetime64(_naive(value), "us").astype(np.int64))
+
+
+class _DeviceRing:
+    """Fixed-capacity ring of one device's readings in recorded_at order."""
+
+    __slots__ = ("columns", "capacity", "max_rows", "head", "count", "since")
+
+    def __init__(self, max_rows: int, since: int, capacity: int = 1024):
+        self.max_rows = max_rows
+        self.capacity = min(capacity, max_rows)
+        self.columns = {name: np.empty(self.capacity, dtype) for name, dtype in RECENT_COLUMNS.items()}
+        self.head = 0  # index of the oldest row once the ring has wrapped
+        self.count = 0
+        self.since = since  # start of the window the ring was hydrated for
+
+    @property
+    def nbytes(self) -> int:
+        return self.capacity * ROW_BYTES
+
+    @property
+    def last(self) -> Optional[int]:
+        if not self.count:
+            return None
+        return int(self.columns["recorded_at"][(self.head + self.count - 1) % self.capacity])
+
+    @property
+    def covered_from(self) -> int:
+        # Once rows have been overwritten the ring only covers its oldest row onwards
+        if self.count == self.max_rows:
+            return int(self.columns["recorded_at"][self.head])
+        return self.since
+
+    def _grow(self):
+        capacity = min(self.capacity * 2, self.max_rows)
+        for name, column in self.columns.items():
+            grown = np.empty(capacity, column.dtype)
+            grown[:self.count] = np.roll(column, -self.head)[:self.count]
+            self.columns[name] = grown
+        self.capacity = capacity
+        self.head = 0
+
+    def append(self, values: Dict[str, Any]):
+        if self.count == self.capacity and self.capacity < self.max_rows:
+            self._grow()
+        if self.count < self.capacity:
+            index = (self.head + self.count) % self.capacity
+            self.count += 1
+        else:
+            # Full: overwrite the oldest row
+            index = self.head
+            self.head = (self.head + 1) % self.capacity
+        for name, value in values.items():
+            self.columns[name][index] = value
+
+    def view(self) -> Dict[str, np.ndarray]:
+        """The rows in time order; a copy only when the ring has wrapped."""
+        if self.head + self.count <= self.capacity:
+            return {name: column[self.head:self.head + self.count] for name, column in self.columns.items()}
+        return {
+            name: np.concatenate((column[self.head:], column[:(self.head + self.count) % self.capacity]))
+            for name, column in self.columns.items()
+        }
+
+
+def _encode(row: dict) -> Dict[str, Any]:
+    values = {"recorded_at": to_micros(row["recorded_at"])}
+    for name in ("mq5_level", "temperature", "humidity"):
+        value = row.get(name)
+        values[name] = np.nan if value is None else value
+    motion = row.get("motion_status")
+    # Rows stored before motion_status was range checked may not fit the uint8 column
+    values["motion_status"] = motion if motion is not None and 0 <= motion < MOTION_MISSING else MOTION_MISSING
+    return values
+
+
+class RecentReadingStore:
+    """
+    Columnar in-memory copy of every active device's recent readings.
+
+    Each device gets a ring of at most `max_rows` readings from the last
+    `window` seconds, stored as int64 timestamps, float32 gas, temperature and
+    humidity and uint8 motion. A ring is hydrated from sensor_data the first
+    time the device is read and then kept current by every stored batch, so
+    recent history and aggregates are answered with array slicing. The least
+    recently read devices are evicted when the rings exceed `memory_budget`
+    bytes. Readings that arrive out of order drop the ring, which is
+    rehydrated on the next read.
+    """
+
+    def __init__(self):
+        self._rings: "OrderedDict[UUID, _DeviceRing]" = OrderedDict()
+        self._loading: Dict[UUID, List[dict]] = {}
+        self._nbytes = 0
+
+    def init(self, enabled: bool, window: int, max_rows: int, memory_budget: int):
+        self._enabled = enabled
+        self._window = window
+        self._max_rows = max_rows
+        self._memory_budget = memory_budget
+
+    @property
+    def enabled(self) -> bool:
+        return self._enabled
+
+    def window_start(self) -> datetime:
+        return datetime.utcnow() - timedelta(seconds=self._window)
+
+    def append(self, rows: List[dict]):
+        """Adds stored rows to the rings of devices that are cached or being hydrated."""
+        if not self._enabled:
+            return
+        for row in rows:
+            device_id = row["device_id"]
+            pending = self._loading.get(device_id)
+            if pending is not None:
+                pending.append(row)
+                continue
+            ring = self._rings.get(device_id)
+            if ring is None:
+                continue
+            values = _encode(row)
+            last = ring.last
+            if last is not None and values["recorded_at"] < last:
+                self.invalidate(device_id)
+                continue
+            before = ring.nbytes
+            ring.append(values)
+            self._nbytes += ring.nbytes - before
+        self._evict()
+
+    def invalidate(self, device_id: UUID):
+        ring = self._rings.pop(device_id, None)
+        if ring is not None:
+            self._nbytes -= ring.nbytes
+
+    def _evict(self):
+        while self._nbytes > self._memory_budget and len(self._rings) > 1:
+            _, ring = self._rings.popitem(last=False)
+            self._nbytes -= ring.nbytes
+
+    async def _hydrate(self, db: AsyncSession, device_id: UUID, since: datetime) -> _DeviceRing:
+        self._loading[device_id] = []
+        try:
+            # Newest first, across partitions until the ring is full
+            rows = []
+            for data in await sensor_partitions.sources(db, since, descending=True):
+                result = await db.execute(
+                    select(data.recorded_at, data.mq5_level, data.temperature, data.humidity, data.motion_status)
+                    .where(data.device_id == device_id, data.recorded_at >= since)
+                    .order_by(data.recorded_at.desc())
+                    .limit(self._max_rows - len(rows))
+                )
+                rows += result.all()
+                if len(rows) >= self._max_rows:
+                    break
+        except BaseException:
+            del self._loading[device_id]
+            raise
+
+        ring = _DeviceRing(self._max_rows, to_micros(since), capacity=max(len(rows), 1024))
+        for recorded_at, mq5_level, temperature, humidity, motion_status in reversed(rows):
+            ring.append(_encode({
+                "recorded_at": recorded_at, "mq5_level": mq5_level, "temperature": temperature,
+                "humidity": humidity, "motion_status": motion_status,
+            }))
+        self._rings[device_id] = ring
+        self._nbytes += ring.nbytes
+
+        # Readings stored while the query ran may or may not be in its result
+        last = ring.last
+        pending = self._loading.pop(device_id)
+        self.append([row for row in pending if last is None or to_micros(row["recorded_at"]) > last])
+        return ring
+
+    async def get(
+        self,
+        db: AsyncSession,
+        device_id: UUID,
+        start: datetime,
+        end: datetime
+    ) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Columns of the readings in [start, end), or None when the range starts
+        before the retained window and must be answered from the database.
+        """
+        if not self._enabled:
+            return None
+        start_us, end_us = to_micros(start), to_micros(end)
+        window_start = self.window_start()
+        if start_us < to_micros(window_start - WINDOW_SLACK):
+            return None
+
+        ring = self._rings.get(device_id)
+        if ring is None:
+            if device_id in self._loading:
+                # Another request is hydrating this device
+                return None
+            ring = await self._hydrate(db, device_id, min(_naive(start), window_start))
+        else:
+            self._rings.move_to_end(device_id)
+        if start_us < ring.covered_from:
+            return None
+
+        columns = ring.view()
+        timestamps = columns["recorded_at"]
+        lo, hi = np.searchsorted(timestamps, [start_us, end_us], side="left")
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def clear(self):
+        self._rings.clear()
+        self._loading.clear()
+        self._nbytes = 0
+
+
+recent_store = RecentReadingStore()
+recent_store.init(
+    enabled=settings.SENSOR_RECENT_ENABLED,
+    window=settings.SENSOR_RECENT_WINDOW_SECONDS,
+    max_rows=settings.SENSOR_RECENT_MAX_ROWS,
+    memory_budget=settings.SENSOR_RECENT_MEMORY_MB * 1024 * 1024,
+)
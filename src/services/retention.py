@@ -0,0 +1,296 @@
+# app/services/retention.py
+"""
+Retention of raw sensor readings and fine-grained rollups.
+
+Raw readings older than SENSOR_RETENTION_DAYS (or a per-device override)
+are deleted, and so are rollups older than their per-resolution retention,
+so hourly and daily rollups can outlive the raw data they summarise.
+Deletes run per device in small chunks along the (device_id, recorded_at)
+index. Every chunk is its own short transaction followed by a pause, so
+the SQLite write lock is never held long enough to stall ingest. Freed
+pages are then returned to the file system with incremental vacuum, in
+steps of SENSOR_VACUUM_PAGES and at most SENSOR_VACUUM_MAX_PASSES steps
+per run. With monthly partitions, a month that is past the
+retention of every device is dropped as a whole instead. With sensor
+shards, each device is purged in its own shard and every shard drops its
+partitions and reclaims its space on its own.
+
+Note that `python -m src.services.rollups rebuild` recomputes rollups from
+the raw readings, so it refuses ranges that may already have been purged.
+
+Usage:
+    python -m src.services.retention                              # one purge pass
+    python -m src.services.retention --enable-incremental-vacuum  # one-off VACUUM to switch the mode
+"""
+import argparse
+import sys
+
+from sqlalchemy import text, update
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+from src.services.database import DatabaseSessionManager, sessionmanager
+from src.services.partitions import sensor_partitions, next_month, partition_name, table_of
+from src.services.shards import sensor_shards
+from src.services.recent import recent_store
+from src.services.rollups import epoch
+
+logger = logging.getLogger(__name__)
+
+
+class RetentionJob:
+    """Periodic chunked purge of expired readings, run from the app lifespan or the CLI."""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    def init(
+        self,
+        days: float,
+        overrides: Dict[str, float],
+        rollup_days: Dict[str, float],
+        chunk_rows: int,
+        pause: float,
+        interval: float,
+        vacuum_pages: int,
+        vacuum_passes: int
+    ):
+        self._days = days
+        # Keys are device ids, values days; 0 keeps that device's readings forever
+        self._overrides = {UUID(device_id): float(value) for device_id, value in overrides.items()}
+        # Keys are rollup resolutions in seconds
+        self._rollup_days = {int(resolution): float(value) for resolution, value in rollup_days.items()}
+        self._chunk_rows = chunk_rows
+        self._pause = pause
+        self._interval = interval
+        self._vacuum_pages = vacuum_pages
+        self._vacuum_passes = vacuum_passes
+
+    @property
+    def enabled(self) -> bool:
+        return self._days > 0 or any(value > 0 for value in self._overrides.values()) or \
+            any(value > 0 for value in self._rollup_days.values())
+
+    async def start(self):
+        if self._task is not None:
+            raise Exception("Retention job is already running")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await self._task
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                purged = await self.purge()
+                logger.info(f"Retention purge removed {purged['sensor_data']} readings and {purged['sensor_rollup']} rollups")
+            except Exception as e:
+                logger.error(f"Retention purge failed: {e}")
+            await asyncio.sleep(self._interval)
+
+    async def purge(self) -> Dict[str, int]:
+        """Runs one purge pass over every device and reclaims the freed space."""
+        now = datetime.utcnow()
+        purged = {"sensor_data": 0, "sensor_rollup": 0}
+
+        async with sessionmanager.session() as db:
+            device_ids = (await db.execute(select(model.Device.device_id))).scalars().all()
+
+        if sensor_partitions.enabled:
+            for manager in sensor_shards.managers():
+                purged["sensor_data"] += await self._drop_partitions(manager, now)
+
+        for device_id in device_ids:
+            days = self._overrides.get(device_id, self._days)
+            if days > 0:
+                purged["sensor_data"] += await self._purge_readings(device_id, now - timedelta(days=days))
+            for resolution, days in self._rollup_days.items():
+                if days > 0:
+                    cutoff = epoch(now - timedelta(days=days))
+                    purged["sensor_rollup"] += await self._purge_rollups(device_id, resolution, cutoff)
+
+        if purged["sensor_data"] or purged["sensor_rollup"]:
+            for manager in sensor_shards.managers():
+                await self._reclaim(manager)
+        return purged
+
+    def raw_cutoff(self, now: datetime, device_id: Optional[UUID] = None) -> Optional[datetime]:
+        """
+        Time before which raw readings may already be purged, for one device or
+        the device with the shortest retention. None when they are kept forever.
+        """
+        if device_id is not None:
+            retentions = [self._overrides.get(device_id, self._days)]
+        else:
+            retentions = [self._days, *self._overrides.values()]
+        retentions = [days for days in retentions if days > 0]
+        if not retentions:
+            return None
+        return now - timedelta(days=min(retentions))
+
+    def _partition_horizon(self, now: datetime) -> Optional[datetime]:
+        # A month can only be dropped once it is past the retention of every device
+        retentions = [self._days, *self._overrides.values()]
+        if min(retentions) <= 0:
+            return None
+        return now - timedelta(days=max(retentions))
+
+    async def _drop_partitions(self, manager: DatabaseSessionManager, now: datetime) -> int:
+        horizon = self._partition_horizon(now)
+        if horizon is None:
+            return 0
+        async with manager.session() as db:
+            months = [month for month in await sensor_partitions.months(db) if next_month(month) <= horizon]
+
+        total = 0
+        for month in months:
+            async with manager.session() as db:
+                data = (await sensor_partitions.sources(db, month, next_month(month)))[0]
+                # Counted along the index so the device summaries can be adjusted after the drop
+                counts = (await db.execute(
+                    select(data.device_id, func.count()).group_by(data.device_id)
+                )).all()
+            async with manager.session() as db:
+                await sensor_partitions.drop(db, month)
+                for device_id, count in counts:
+                    await self._update_summary(db, device_id, count)
+                await db.commit()
+            for device_id, _ in counts:
+                recent_store.invalidate(device_id)
+            logger.info(f"Dropped {partition_name(month)}")
+            total += sum(count for _, count in counts)
+        return total
+
+    async def _update_summary(self, db: AsyncSession, device_id: UUID, deleted: int):
+        # Keep the device summary in step without recounting the remaining readings
+        first_recorded_at = None
+        for data in await sensor_partitions.sources(db):
+            first_recorded_at = await db.scalar(
+                select(func.min(data.recorded_at)).where(data.device_id == device_id)
+            )
+            if first_recorded_at is not None:
+                break
+        await db.execute(
+            update(model.DeviceSummary)
+            .where(model.DeviceSummary.device_id == device_id)
+            .values(
+                reading_count=model.DeviceSummary.reading_count - deleted,
+                first_recorded_at=first_recorded_at,
+            )
+        )
+
+    async def _purge_readings(self, device_id: UUID, cutoff: datetime) -> int:
+        async with sensor_shards.manager(device_id).session() as db:
+            sources = await sensor_partitions.sources(db, end=cutoff)
+        total = 0
+        for data in sources:
+            table = table_of(data)
+            expired = (
+                select(table.c.data_id)
+                .where(table.c.device_id == device_id, table.c.recorded_at < cutoff)
+                .order_by(table.c.recorded_at)
+                .limit(self._chunk_rows)
+            )
+            while True:
+                async with sensor_shards.manager(device_id).session() as db:
+                    result = await db.execute(delete(table).where(table.c.data_id.in_(expired.scalar_subquery())))
+                    deleted = result.rowcount
+                    if deleted:
+                        await self._update_summary(db, device_id, deleted)
+                    await db.commit()
+                total += deleted
+                if deleted < self._chunk_rows:
+                    break
+                await asyncio.sleep(self._pause)
+        if total:
+            # A retention shorter than the recent window leaves purged rows in the ring
+            recent_store.invalidate(device_id)
+        return total
+
+    async def _purge_rollups(self, device_id: UUID, resolution: int, cutoff: int) -> int:
+        rollup = model.SensorRollup
+        expired = [rollup.device_id == device_id, rollup.resolution == resolution, rollup.bucket_start < cutoff]
+        total = 0
+        while True:
+            async with sensor_shards.manager(device_id).session() as db:
+                # Last bucket of the next chunk, found along the primary key
+                boundary = await db.scalar(
+                    select(rollup.bucket_start).where(*expired)
+                    .order_by(rollup.bucket_start).offset(self._chunk_rows - 1).limit(1)
+                )
+                chunk = expired if boundary is None else expired + [rollup.bucket_start <= boundary]
+                result = await db.execute(delete(rollup).where(*chunk))
+                await db.commit()
+            total += result.rowcount
+            if boundary is None:
+                return total
+            await asyncio.sleep(self._pause)
+
+    async def _reclaim(self, manager: DatabaseSessionManager):
+        async with manager.session() as db:
+            if db.get_bind().dialect.name != "sqlite":
+                # PostgreSQL's autovacuum reclaims the space
+                return
+            if await db.scalar(text("PRAGMA auto_vacuum")) != 2:
+                logger.info("auto_vacuum is not INCREMENTAL, freed pages are reused but not returned; "
+                            "run python -m src.services.retention --enable-incremental-vacuum once")
+                return
+        remaining = 0
+        for _ in range(self._vacuum_passes):
+            async with manager.connect() as conn:
+                raw = await conn.get_raw_connection()
+                # Executed as a statement, the pragma is stepped once and frees a single page;
+                # executescript runs it to completion
+                await raw.driver_connection.executescript(f"PRAGMA incremental_vacuum({self._vacuum_pages})")
+                remaining = (await conn.exec_driver_sql("PRAGMA freelist_count")).scalar()
+            if not remaining:
+                return
+            await asyncio.sleep(self._pause)
+        logger.info("%d free pages left for the next retention run", remaining)
+
+
+retention_job = RetentionJob()
+retention_job.init(
+    days=settings.SENSOR_RETENTION_DAYS,
+    overrides=json.loads(settings.SENSOR_RETENTION_OVERRIDES or "{}"),
+    rollup_days=json.loads(settings.SENSOR_ROLLUP_RETENTION_DAYS or "{}"),
+    chunk_rows=settings.SENSOR_PURGE_CHUNK_ROWS,
+    pause=settings.SENSOR_PURGE_PAUSE,
+    interval=settings.SENSOR_RETENTION_INTERVAL,
+    vacuum_pages=settings.SENSOR_VACUUM_PAGES,
+    vacuum_passes=settings.SENSOR_VACUUM_MAX_PASSES,
+)
+
+
+async def enable_incremental_vacuum():
+    # auto_vacuum only changes with a full VACUUM, which rewrites the file and blocks writers while it runs
+    for manager in dict.fromkeys([sessionmanager, *sensor_shards.managers()]):
+        async with manager.connect() as conn:
+            await conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.exec_driver_sql("VACUUM")
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Purge sensor readings and rollups past their retention.")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Switch the SQLite database to incremental auto_vacuum (runs a full VACUUM once)")
+    args = parser.parse_args(argv)
+
+    if args.enable_incremental_vacuum:
+        await enable_incremental_vacuum()
+    elif not retention_job.enabled:
+        print("No retention configured, set SENSOR_RETENTION_DAYS or SENSOR_ROLLUP_RETENTION_DAYS", file=sys.stderr)
+    else:
+        print(json.dumps(await retention_job.purge()))
+    await sensor_shards.close()
+    await sessionmanager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,410 @@
+# app/services/rollups.py
+"""
+Incrementally maintained 1 minute, 1 hour and 1 day rollups of sensor_data.
+
+Every stored batch of readings is folded into sensor_rollup in the same
+transaction, so aggregate queries read a few rollup rows per bucket instead
+of every raw reading. Rollup buckets are aligned to the Unix epoch and
+hold counts, sums, minimums and maximums, which can be merged into any
+coarser bucket that is a multiple of the resolution.
+
+The same transaction also maintains device_summary, the all-time reading
+count and first and last recorded_at of every device, so device listings
+do not have to scan the readings.
+
+Updated or deleted readings rebuild their buckets in place, except for
+buckets that may have outlived purged readings, which are adjusted by the
+reading's old and new values instead. After a bulk
+load outside the API or any other change to sensor_data, rebuild the
+affected range. With a retention policy, rebuilds must start after the
+raw retention cutoff, since older buckets outlive the purged readings:
+
+Usage:
+    python -m src.services.rollups rebuild
+    python -m src.services.rollups rebuild --device-id <uuid> --from 2024-01-01 --to 2024-02-01
+"""
+import argparse
+import sys
+
+from sqlalchemy import Integer, case, literal, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+from src.services.partitions import sensor_partitions
+
+ROLLUP_RESOLUTIONS = (60, 3600, 86400)
+ROLLUP_FIELDS = ("mq5_level", "temperature", "humidity")
+
+
+def epoch(value: datetime) -> int:
+    """Unix seconds of a timestamp, naive values being UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def epoch_seconds(db: AsyncSession, column):
+    """SQL expression for the Unix seconds of a timestamp column."""
+    if db.get_bind().dialect.name == "sqlite":
+        return func.cast(func.strftime("%s", column), Integer)
+    return func.cast(func.floor(func.extract("epoch", column)), Integer)
+
+
+def supported(db: AsyncSession) -> bool:
+    # Incremental maintenance relies on INSERT .. ON CONFLICT DO UPDATE
+    return settings.SENSOR_ROLLUPS_ENABLED and db.get_bind().dialect.name in ("sqlite", "postgresql")
+
+
+def resolution_for(bucket_seconds: int) -> int:
+    """Coarsest rollup resolution that divides the bucket evenly."""
+    return max(resolution for resolution in ROLLUP_RESOLUTIONS if bucket_seconds % resolution == 0)
+
+
+def _bucket_deltas(rows: List[dict]) -> List[dict]:
+    # Fold the rows into one partial rollup per device, resolution and bucket
+    buckets: Dict[Tuple[UUID, int, int], dict] = {}
+    for row in rows:
+        seconds = epoch(row["recorded_at"])
+        for resolution in ROLLUP_RESOLUTIONS:
+            key = (row["device_id"], resolution, seconds - seconds % resolution)
+            delta = buckets.get(key)
+            if delta is None:
+                delta = buckets[key] = {
+                    "device_id": key[0], "resolution": resolution, "bucket_start": key[2],
+                    "count": 0, "motion_count": 0,
+                }
+                for field in ROLLUP_FIELDS:
+                    delta.update({f"{field}_count": 0, f"{field}_sum": 0.0, f"{field}_min": None, f"{field}_max": None})
+            delta["count"] += 1
+            if row["motion_status"]:
+                delta["motion_count"] += 1
+            for field in ROLLUP_FIELDS:
+                value = row[field]
+                if value is None:
+                    continue
+                delta[f"{field}_count"] += 1
+                delta[f"{field}_sum"] += value
+                if delta[f"{field}_min"] is None or value < delta[f"{field}_min"]:
+                    delta[f"{field}_min"] = value
+                if delta[f"{field}_max"] is None or value > delta[f"{field}_max"]:
+                    delta[f"{field}_max"] = value
+    return list(buckets.values())
+
+
+def _merge_upsert(db: AsyncSession):
+    table = model.SensorRollup.__table__
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite.insert(table)
+        # SQLite's two-argument min()/max() return NULL if either side is NULL
+        lowest = lambda a, b: func.min(func.coalesce(a, b), func.coalesce(b, a))
+        highest = lambda a, b: func.max(func.coalesce(a, b), func.coalesce(b, a))
+    else:
+        stmt = postgresql.insert(table)
+        lowest, highest = func.least, func.greatest
+
+    merged = {
+        "count": table.c.count + stmt.excluded.count,
+        "motion_count": table.c.motion_count + stmt.excluded.motion_count,
+    }
+    for field in ROLLUP_FIELDS:
+        merged[f"{field}_count"] = table.c[f"{field}_count"] + stmt.excluded[f"{field}_count"]
+        merged[f"{field}_sum"] = table.c[f"{field}_sum"] + stmt.excluded[f"{field}_sum"]
+        merged[f"{field}_min"] = lowest(table.c[f"{field}_min"], stmt.excluded[f"{field}_min"])
+        merged[f"{field}_max"] = highest(table.c[f"{field}_max"], stmt.excluded[f"{field}_max"])
+    return stmt.on_conflict_do_update(index_elements=["device_id", "resolution", "bucket_start"], set_=merged)
+
+
+def _summary_deltas(rows: List[dict]) -> List[dict]:
+    summaries: Dict[UUID, dict] = {}
+    for row in rows:
+        summary = summaries.get(row["device_id"])
+        if summary is None:
+            summaries[row["device_id"]] = {
+                "device_id": row["device_id"], "reading_count": 1,
+                "first_recorded_at": row["recorded_at"], "last_recorded_at": row["recorded_at"],
+            }
+            continue
+        summary["reading_count"] += 1
+        summary["first_recorded_at"] = min(summary["first_recorded_at"], row["recorded_at"])
+        summary["last_recorded_at"] = max(summary["last_recorded_at"], row["recorded_at"])
+    return list(summaries.values())
+
+
+def _summary_upsert(db: AsyncSession):
+    table = model.DeviceSummary.__table__
+    if db.get_bind().dialect.name == "sqlite":
+        stmt = sqlite.insert(table)
+        lowest, highest = func.min, func.max
+    else:
+        stmt = postgresql.insert(table)
+        lowest, highest = func.least, func.greatest
+    return stmt.on_conflict_do_update(index_elements=["device_id"], set_={
+        "reading_count": table.c.reading_count + stmt.excluded.reading_count,
+        "first_recorded_at": lowest(func.coalesce(table.c.first_recorded_at, stmt.excluded.first_recorded_at),
+                                    stmt.excluded.first_recorded_at),
+        "last_recorded_at": highest(func.coalesce(table.c.last_recorded_at, stmt.excluded.last_recorded_at),
+                                    stmt.excluded.last_recorded_at),
+    })
+
+
+async def apply_rows(db: AsyncSession, rows: List[dict]) -> None:
+    """Adds newly inserted reading rows to their rollup buckets and device summaries. Does not commit."""
+    if rows:
+        await db.execute(_merge_upsert(db), _bucket_deltas(rows))
+        await db.execute(_summary_upsert(db), _summary_deltas(rows))
+
+
+async def merge_rows(db: AsyncSession, rollup_rows: List[dict], summary_rows: List[dict]) -> None:
+    """Adds sensor_rollup and device_summary rows computed in another database. Does not commit."""
+    if rollup_rows:
+        await db.execute(_merge_upsert(db), rollup_rows)
+    if summary_rows:
+        await db.execute(_summary_upsert(db), summary_rows)
+
+
+def _retract(db: AsyncSession, row: dict, resolution: int):
+    # Takes one reading back out of its bucket; the minimum and maximum cannot be narrowed without the raw readings
+    table = model.SensorRollup.__table__
+    seconds = epoch(row["recorded_at"])
+    values = {"count": table.c.count - 1}
+    if row["motion_status"]:
+        values["motion_count"] = table.c.motion_count - 1
+    for field in ROLLUP_FIELDS:
+        if row[field] is not None:
+            values[f"{field}_count"] = table.c[f"{field}_count"] - 1
+            values[f"{field}_sum"] = table.c[f"{field}_sum"] - row[field]
+    return update(table).where(
+        table.c.device_id == row["device_id"],
+        table.c.resolution == resolution,
+        table.c.bucket_start == seconds - seconds % resolution,
+    ).values(**values)
+
+
+async def replace_reading(
+    db: AsyncSession,
+    old: dict,
+    new: Optional[dict],
+    raw_cutoff: Optional[datetime]
+) -> None:
+    """
+    Moves an updated reading from its `old` to its `new` values, or removes it
+    when `new` is None. Buckets starting at or after `raw_cutoff` are rebuilt
+    from sensor_data; older ones may have outlived purged readings, so only
+    the reading's own counts and sums are adjusted and their minimum and
+    maximum are at most widened. Does not commit.
+    """
+    seconds = epoch(old["recorded_at"])
+    for resolution in ROLLUP_RESOLUTIONS:
+        bucket_start = seconds - seconds % resolution
+        if raw_cutoff is None or bucket_start >= epoch(raw_cutoff):
+            await rebuild(db, old["device_id"], old["recorded_at"], old["recorded_at"], resolutions=(resolution,))
+            continue
+        await db.execute(_retract(db, old, resolution))
+        if new is not None:
+            await db.execute(_merge_upsert(db), [
+                delta for delta in _bucket_deltas([new]) if delta["resolution"] == resolution
+            ])
+        else:
+            await db.execute(delete(model.SensorRollup).where(
+                model.SensorRollup.device_id == old["device_id"],
+                model.SensorRollup.resolution == resolution,
+                model.SensorRollup.bucket_start == bucket_start,
+                model.SensorRollup.count <= 0,
+            ))
+
+
+async def rebuild_summaries(db: AsyncSession, device_id: Optional[UUID] = None) -> None:
+    """Recomputes device_summary from sensor_data for one device or all of them. Does not commit."""
+    summary_filter = []
+    if device_id is not None:
+        summary_filter.append(model.DeviceSummary.device_id == device_id)
+    await db.execute(delete(model.DeviceSummary).where(*summary_filter))
+
+    # Summarised per partition, then combined for devices with readings in several
+    parts = []
+    for data in await sensor_partitions.sources(db):
+        raw_filter = [data.device_id == device_id] if device_id is not None else []
+        parts.append(
+            select(
+                data.device_id,
+                func.count().label("reading_count"),
+                func.min(data.recorded_at).label("first_recorded_at"),
+                func.max(data.recorded_at).label("last_recorded_at"),
+            )
+            .where(*raw_filter)
+            .group_by(data.device_id)
+        )
+    if not parts:
+        return
+    combined = union_all(*parts).subquery()
+    await db.execute(
+        insert(model.DeviceSummary).from_select(
+            ["device_id", "reading_count", "first_recorded_at", "last_recorded_at"],
+            select(
+                combined.c.device_id,
+                func.sum(combined.c.reading_count),
+                func.min(combined.c.first_recorded_at),
+                func.max(combined.c.last_recorded_at),
+            )
+            .group_by(combined.c.device_id),
+        )
+    )
+
+
+async def rebuild(
+    db: AsyncSession,
+    device_id: Optional[UUID] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    resolutions: Tuple[int, ...] = ROLLUP_RESOLUTIONS
+) -> None:
+    """
+    Recomputes every rollup bucket that overlaps [start, end] from sensor_data,
+    for one device or all of them. Does not commit.
+    """
+    for resolution in resolutions:
+        rollup_filter = [model.SensorRollup.resolution == resolution]
+        low = high = None
+        if device_id is not None:
+            rollup_filter.append(model.SensorRollup.device_id == device_id)
+        # Widen the range to whole buckets so partially covered buckets are recomputed completely
+        if start is not None:
+            first = epoch(start) - epoch(start) % resolution
+            rollup_filter.append(model.SensorRollup.bucket_start >= first)
+            low = datetime.utcfromtimestamp(first)
+        if end is not None:
+            last = epoch(end) - epoch(end) % resolution + resolution
+            rollup_filter.append(model.SensorRollup.bucket_start < last)
+            high = datetime.utcfromtimestamp(last)
+
+        await db.execute(delete(model.SensorRollup).where(*rollup_filter))
+
+        # Resolutions divide a day and partitions start at midnight, so every bucket comes from one partition
+        for data in await sensor_partitions.sources(db, low, high):
+            raw_filter = []
+            if device_id is not None:
+                raw_filter.append(data.device_id == device_id)
+            if low is not None:
+                raw_filter.append(data.recorded_at >= low)
+            if high is not None:
+                raw_filter.append(data.recorded_at < high)
+
+            bucket_start = epoch_seconds(db, data.recorded_at) // resolution * resolution
+            columns = {
+                "device_id": data.device_id,
+                "resolution": literal(resolution),
+                "bucket_start": bucket_start,
+                "count": func.count(),
+                "motion_count": func.sum(case((data.motion_status > 0, 1), else_=0)),
+            }
+            for field in ROLLUP_FIELDS:
+                column = getattr(data, field)
+                columns[f"{field}_count"] = func.count(column)
+                columns[f"{field}_sum"] = func.coalesce(func.sum(column), 0.0)
+                columns[f"{field}_min"] = func.min(column)
+                columns[f"{field}_max"] = func.max(column)
+
+            await db.execute(
+                insert(model.SensorRollup).from_select(
+                    list(columns),
+                    select(*columns.values())
+                    .where(*raw_filter)
+                    .group_by(data.device_id, bucket_start),
+                )
+            )
+
+
+async def delete_device(db: AsyncSession, device_id: UUID) -> None:
+    """Removes a device's rollups and summary before the device is deleted. Does not commit."""
+    await db.execute(delete(model.SensorRollup).where(model.SensorRollup.device_id == device_id))
+    await db.execute(delete(model.DeviceSummary).where(model.DeviceSummary.device_id == device_id))
+
+
+def aggregate_query(device_id: UUID, bucket_seconds: int, start: datetime, end: datetime):
+    """
+    Same columns as the raw aggregate query in crud.sensordata, merged from
+    the coarsest rollup that fits the bucket size.
+    """
+    resolution = resolution_for(bucket_seconds)
+    rollup = model.SensorRollup
+    bucket_start = (rollup.bucket_start // bucket_seconds * bucket_seconds).label("bucket_start")
+
+    columns = [bucket_start, func.sum(rollup.count)]
+    for field in ROLLUP_FIELDS:
+        count = func.sum(getattr(rollup, f"{field}_count"))
+        columns += [
+            func.min(getattr(rollup, f"{field}_min")),
+            func.max(getattr(rollup, f"{field}_max")),
+            func.sum(getattr(rollup, f"{field}_sum")) / func.nullif(count, 0),
+        ]
+    columns.append(func.sum(rollup.motion_count))
+
+    return (
+        select(*columns)
+        .where(
+            rollup.device_id == device_id,
+            rollup.resolution == resolution,
+            rollup.bucket_start >= epoch(start),
+            rollup.bucket_start < epoch(end),
+        )
+        .group_by(bucket_start)
+        .order_by(bucket_start)
+    )
+
+
+def series_query(device_id: UUID, field: str, resolution: int, start: datetime, end: datetime):
+    """Bucket start and mean of one field for every rollup bucket in the range that has a value."""
+    rollup = model.SensorRollup
+    count = getattr(rollup, f"{field}_count")
+    return (
+        select(rollup.bucket_start, getattr(rollup, f"{field}_sum") / count)
+        .where(
+            rollup.device_id == device_id,
+            rollup.resolution == resolution,
+            rollup.bucket_start >= epoch(start) - epoch(start) % resolution,
+            rollup.bucket_start < epoch(end),
+            count > 0,
+        )
+        .order_by(rollup.bucket_start)
+    )
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    from src.services.database import sessionmanager
+    from src.services.shards import sensor_shards
+
+    parser = argparse.ArgumentParser(description="Maintain sensor_data rollups.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = commands.add_parser("rebuild", help="Recompute rollups and device summaries from sensor_data")
+    rebuild_parser.add_argument("--device-id", type=UUID, help="Only this device, default all devices")
+    rebuild_parser.add_argument("--from", dest="start", type=datetime.fromisoformat, help="UTC, default the beginning")
+    rebuild_parser.add_argument("--to", dest="end", type=datetime.fromisoformat, help="UTC, default the end")
+    args = parser.parse_args(argv)
+
+    from src.services.retention import retention_job
+    cutoff = retention_job.raw_cutoff(datetime.utcnow(), args.device_id)
+    if cutoff is not None:
+        # Rebuilt buckets are widened to whole days, so the first one must start after the cutoff
+        day = max(ROLLUP_RESOLUTIONS)
+        if args.start is None or epoch(args.start) // day * day < epoch(cutoff):
+            first_day = datetime.utcfromtimestamp(-(-epoch(cutoff) // day) * day)
+            print(f"Raw readings before {cutoff:%Y-%m-%d %H:%M} may be purged and their rollups kept, "
+                  f"pass --from {first_day:%Y-%m-%d} or later", file=sys.stderr)
+            return 1
+
+    async def rebuild_shard(db: AsyncSession, device_ids: Optional[List[UUID]]):
+        await rebuild(db, args.device_id, args.start, args.end)
+        await rebuild_summaries(db, args.device_id)
+        await db.commit()
+
+    async with sessionmanager.session() as db:
+        await sensor_shards.gather(db, rebuild_shard, [args.device_id] if args.device_id else None)
+    await sensor_shards.close()
+    await sessionmanager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
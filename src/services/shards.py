@@ -0,0 +1,249 @@
+# app/services/shards.py
+"""
+Opt-in hash sharding of sensor readings across several databases.
+
+SQLite allows one writer per file, so with a single database every home's
+readings queue behind the same write lock. With SENSOR_SHARD_COUNT above 1,
+sensor_data (and its monthly partitions), sensor_rollup and device_summary
+move to SENSOR_SHARD_COUNT databases built from SENSOR_SHARD_URL. Each shard
+has its own engine and its own writer, and a device's readings always go
+to the same shard, chosen from a hash of its device_id. User, device and
+token tables stay in the primary database.
+
+Work for several devices is split by shard and run on all shards
+concurrently, each with its own session and transaction. A batch that
+spans shards is therefore committed shard by shard rather than atomically:
+each shard stores all of its devices' readings or none of them, and
+ShardWriteError names the devices whose readings were not stored.
+
+Readings stored in the primary database before sharding was switched on
+are not read in this mode; move them, with their rollups and summaries,
+using `migrate`. Readings are not rebalanced when the shard count
+changes, so choose it before storing data.
+
+Usage:
+    python -m src.services.shards migrate   # move the primary database's readings into the shards
+"""
+import argparse
+import functools
+import hashlib
+import sys
+import zlib
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, Uuid
+from sqlalchemy.dialects import postgresql, sqlite
+from src.utils.commonImports import *
+from src.utils.config import settings
+from src.models import model
+from src.services.database import DatabaseSessionManager, sessionmanager
+from src.services.partitions import sensor_partitions, table_of
+
+logger = logging.getLogger(__name__)
+
+# Per-device tables that live in the shards; monthly partitions are created there on demand
+SHARD_TABLES = (model.SensorData.__table__, model.SensorRollup.__table__, model.DeviceSummary.__table__)
+
+# Rollups and summaries `migrate` has merged into a shard, by device and a digest of the rows, so a rerun after an
+# interruption does not add them twice. It exists only in the shards and is not part of the primary schema.
+merged_rollups = Table(
+    "shard_merged_rollups",
+    MetaData(),
+    Column("device_id", Uuid, primary_key=True),
+    Column("digest", String(64), primary_key=True),
+    Column("merged_at", DateTime, nullable=False),
+)
+
+
+class ShardWriteError(Exception):
+    """Raised when some shards failed to commit their part of a write; the other shards committed theirs."""
+
+    def __init__(self, device_ids: set, error: Exception):
+        super().__init__(str(error))
+        self.device_ids = device_ids
+        self.error = error
+
+
+class SensorShards:
+    """Session managers of the sensor shards and routing of devices to them."""
+
+    def __init__(self):
+        self._shards: List[DatabaseSessionManager] = []
+
+    def init(self, count: int, url: str):
+        self._shards = []
+        if count > 1:
+            for shard in range(count):
+                manager = DatabaseSessionManager()
+                manager.init(url.format(shard=shard).replace("sqlite://", "sqlite+aiosqlite://"))
+                self._shards.append(manager)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._shards)
+
+    def managers(self) -> List[DatabaseSessionManager]:
+        """Every database that holds readings: the shards, or just the primary database."""
+        return self._shards or [sessionmanager]
+
+    def _index(self, device_id: UUID) -> int:
+        # crc32 rather than hash() so the shard of a device is the same in every process
+        return zlib.crc32(device_id.bytes) % len(self._shards)
+
+    def manager(self, device_id: UUID) -> DatabaseSessionManager:
+        if not self._shards:
+            return sessionmanager
+        return self._shards[self._index(device_id)]
+
+    @contextlib.asynccontextmanager
+    async def session(self, db: AsyncSession, device_id: UUID) -> AsyncIterator[AsyncSession]:
+        """Session for a device's readings: `db` itself unless sharding is on."""
+        if not self._shards:
+            yield db
+            return
+        async with self.manager(device_id).session() as shard_db:
+            yield shard_db
+
+    async def gather(self, db: AsyncSession, fn, device_ids: Optional[List[UUID]] = None) -> list:
+        """
+        Runs `fn(session, device_ids)` once per shard, concurrently, and returns
+        the results. With device ids, only shards holding one of them run and
+        each gets its own devices; without, every shard runs with None. Without
+        sharding, `fn` runs once on `db`.
+        """
+        if not self._shards:
+            return [await fn(db, device_ids)]
+
+        if device_ids is None:
+            groups = {index: None for index in range(len(self._shards))}
+        else:
+            groups: Dict[int, List[UUID]] = {}
+            for device_id in device_ids:
+                groups.setdefault(self._index(device_id), []).append(device_id)
+
+        async def run(index: int, ids: Optional[List[UUID]]):
+            async with self._shards[index].session() as shard_db:
+                return await fn(shard_db, ids)
+
+        return list(await asyncio.gather(*(run(index, ids) for index, ids in groups.items())))
+
+    async def create_all(self):
+        """Creates the sensor tables in every shard that does not have them yet."""
+        for manager in self._shards:
+            async with manager.connect() as conn:
+                await conn.run_sync(lambda sync_conn: model.Base.metadata.create_all(
+                    sync_conn, tables=list(SHARD_TABLES), checkfirst=True))
+                await conn.run_sync(lambda sync_conn: merged_rollups.create(sync_conn, checkfirst=True))
+
+    async def warn_unmigrated(self):
+        """Logs a warning when the primary database still holds readings that sharding hides."""
+        async with sessionmanager.session() as db:
+            for data in await sensor_partitions.sources(db):
+                if await db.scalar(select(data.data_id).limit(1)) is not None:
+                    logger.warning("The primary database still holds sensor readings, which are not read while "
+                                   "sharding is on; move them with python -m src.services.shards migrate")
+                    break
+
+    async def close(self):
+        for manager in self._shards:
+            await manager.close()
+        self._shards = []
+
+
+sensor_shards = SensorShards()
+sensor_shards.init(count=settings.SENSOR_SHARD_COUNT, url=settings.SENSOR_SHARD_URL)
+
+
+def by_device(fn):
+    """Runs a crud function taking (db, device_id, ...) on the session of the device's shard."""
+    @functools.wraps(fn)
+    async def wrapper(db: AsyncSession, device_id: UUID, *args, **kwargs):
+        async with sensor_shards.session(db, device_id) as shard_db:
+            return await fn(shard_db, device_id, *args, **kwargs)
+    return wrapper
+
+
+def _insert_ignoring_duplicates(db: AsyncSession, table):
+    if db.get_bind().dialect.name == "postgresql":
+        return postgresql.insert(table).on_conflict_do_nothing()
+    return sqlite.insert(table).on_conflict_do_nothing()
+
+
+async def migrate(db: AsyncSession, chunk_rows: int) -> int:
+    """
+    Moves the readings, rollups and summaries in the primary database `db`
+    into the shards, committing every chunk. Moved rows are deleted from the
+    primary, so an interrupted migration is resumed by running it again:
+    readings already copied are skipped by their data_id, and rollups already
+    merged by the digest recorded with them in the shard.
+    """
+    from src.services import rollups
+
+    moved = 0
+    for data in await sensor_partitions.sources(db):
+        table = table_of(data)
+        while True:
+            # Moved rows are deleted, so the next chunk is simply the first rows left
+            rows = [dict(row._mapping) for row in (await db.execute(select(table).limit(chunk_rows))).all()]
+            if not rows:
+                break
+            grouped: Dict[DatabaseSessionManager, List[dict]] = {}
+            for row in rows:
+                grouped.setdefault(sensor_shards.manager(row["device_id"]), []).append(row)
+            for manager, part in grouped.items():
+                async with manager.session() as shard_db:
+                    for entity, month_rows in await sensor_partitions.route(shard_db, part):
+                        await shard_db.execute(_insert_ignoring_duplicates(shard_db, table_of(entity)), month_rows)
+                    await shard_db.commit()
+            await db.execute(delete(table).where(table.c.data_id.in_([row["data_id"] for row in rows])))
+            await db.commit()
+            moved += len(rows)
+
+    # Rollups and summaries are merged into the shard's own, which cover the readings stored since the switch.
+    # Rebuilding them from the readings instead would lose rollups that outlived purged readings.
+    rollup, summary = model.SensorRollup.__table__, model.DeviceSummary.__table__
+    device_ids = (await db.execute(
+        select(summary.c.device_id).union(select(rollup.c.device_id))
+    )).scalars().all()
+    for device_id in device_ids:
+        rollup_rows = [dict(row._mapping) for row in (await db.execute(
+            select(rollup).where(rollup.c.device_id == device_id)
+            .order_by(rollup.c.resolution, rollup.c.bucket_start))).all()]
+        # A summary left empty by retention has nothing to add
+        summary_rows = [dict(row._mapping) for row in (await db.execute(
+            select(summary).where(summary.c.device_id == device_id, summary.c.reading_count > 0))).all()]
+        digest = hashlib.sha256(json.dumps([rollup_rows, summary_rows], default=str).encode()).hexdigest()
+        async with sensor_shards.manager(device_id).session() as shard_db:
+            # The merge and its record commit together, unlike the delete from the primary that follows
+            merged = await shard_db.scalar(select(merged_rollups.c.digest).where(
+                merged_rollups.c.device_id == device_id, merged_rollups.c.digest == digest))
+            if merged is None:
+                await rollups.merge_rows(shard_db, rollup_rows, summary_rows)
+                await shard_db.execute(insert(merged_rollups).values(
+                    device_id=device_id, digest=digest, merged_at=datetime.utcnow()))
+                await shard_db.commit()
+        await db.execute(delete(rollup).where(rollup.c.device_id == device_id))
+        await db.execute(delete(summary).where(summary.c.device_id == device_id))
+        await db.commit()
+    return moved
+
+
+async def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the sensor shards.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate_parser = commands.add_parser("migrate", help="Move the primary database's readings into the shards")
+    migrate_parser.add_argument("--chunk-rows", type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    if not sensor_shards.enabled:
+        print("Sharding is off, set SENSOR_SHARD_COUNT above 1", file=sys.stderr)
+        return 1
+    await sensor_shards.create_all()
+    async with sessionmanager.session() as db:
+        print(f"Moved {await migrate(db, args.chunk_rows)} readings")
+    await sensor_shards.close()
+    await sessionmanager.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -2,53 +2,411 @@ import serial
 import uuid
 import json
 import httpx
+import random
+import sqlite3
 import asyncio
-from datetime import datetime
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
 
 # Replace `your_fastapi_url` with the actual endpoint URL for your FastAPI app
 FASTAPI_URL = "http://127.0.0.1:8000/sensor/"
+DEVICE_ID = "d484db62-5506-496d-b70c-f6a2d1f3eb7c"  # Replace with actual device ID
+SPOOL_PATH = "sensor_spool.db"
+DEFAULT_BAUDRATE = 9600
+# Seconds a serial thread waits on a full queue before checking whether the reader is stopping
+PUT_TIMEOUT = 1.0
+
+# Outcomes of an upload attempt
+SENT, RETRY, REJECTED = "sent", "retry", "rejected"
+
+class ReadingSpool:
+    """
+    Disk-backed FIFO of readings that could not be uploaded.
+
+    Backed by a local SQLite file in WAL mode, so appends and acknowledgements
+    only touch the pages they change and the queue survives restarts. The
+    spool holds at most `max_rows` readings; when it is full the oldest
+    readings are dropped, and freed pages are returned to the file system
+    incrementally.
+    """
+
+    def __init__(self, path=SPOOL_PATH, max_rows=500_000):
+        self.max_rows = max_rows
+        self._db = sqlite3.connect(path)
+        # auto_vacuum only takes effect on a new file, before the first table is created
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, reading TEXT NOT NULL)")
+        self._db.commit()
+        self._count = self._db.execute("SELECT count(*) FROM spool").fetchone()[0]
+
+    def __len__(self):
+        return self._count
+
+    def append(self, readings):
+        with self._db:
+            self._db.executemany("INSERT INTO spool (reading) VALUES (?)", [(json.dumps(r),) for r in readings])
+            self._count += len(readings)
+            overflow = self._count - self.max_rows
+            if overflow > 0:
+                self._db.execute("DELETE FROM spool WHERE id IN (SELECT id FROM spool ORDER BY id LIMIT ?)", (overflow,))
+                self._count -= overflow
+                print(f"Spool full, dropped {overflow} oldest readings.")
+
+    def peek(self, limit):
+        rows = self._db.execute("SELECT id, reading FROM spool ORDER BY id LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows], [json.loads(row[1]) for row in rows]
+
+    def ack(self, ids):
+        if not ids:
+            return
+        with self._db:
+            deleted = self._db.execute("DELETE FROM spool WHERE id BETWEEN ? AND ?", (ids[0], ids[-1])).rowcount
+            self._count -= deleted
+        # Executed as a statement, the pragma is stepped once and frees a single page
+        self._db.executescript("PRAGMA incremental_vacuum(64)")
+
+    def close(self):
+        self._db.close()
+
+def load_port_config(path):
+    """
+    Loads the port to device mapping of a gateway from a JSON file:
+
+        {"ports": {"/dev/ttyUSB0": {"device_id": "<uuid>", "baudrate": 9600},
+                   "/dev/ttyUSB1": "<uuid>"}}
+
+    A plain string value is the device id with the default baudrate.
+    """
+    with open(path) as f:
+        config = json.load(f)
+    ports = {}
+    for comport, port in config.get("ports", config).items():
+        if isinstance(port, str):
+            port = {"device_id": port}
+        ports[comport] = {"device_id": port["device_id"], "baudrate": int(port.get("baudrate", DEFAULT_BAUDRATE))}
+    return ports
+
+class DeadbandFilter:
+    """
+    Change-only filter applied on the gateway before readings are queued.
+
+    A reading is sent when a numeric field moved by more than its deadband
+    since the last reading sent for the device, when motion_status or the
+    presence of a value changed, or when `heartbeat` seconds have passed, so
+    the API can treat a gap shorter than the heartbeat as "unchanged".
+    """
+
+    FIELDS = ("temperature", "humidity", "mq5_level")
+
+    def __init__(self, deadbands, heartbeat=60.0):
+        self.deadbands = {field: float(deadbands.get(field, 0.0)) for field in self.FIELDS}
+        self.heartbeat = heartbeat
+        self._last = {}
+        self._lock = threading.Lock()
+
+    def _changed(self, previous, reading):
+        if previous.get("motion_status") != reading.get("motion_status"):
+            return True
+        for field, deadband in self.deadbands.items():
+            old, new = previous.get(field), reading.get(field)
+            if (old is None) != (new is None):
+                return True
+            if new is None:
+                continue
+            try:
+                # NaN compares false, so it counts as a change as well
+                if not abs(float(new) - float(old)) <= deadband:
+                    return True
+            except (TypeError, ValueError):
+                # Not a number; send it and let the API validate it
+                return True
+        return False
+
+    def should_send(self, reading):
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(reading["device_id"])
+            if last is not None and now - last[0] < self.heartbeat and not self._changed(last[1], reading):
+                return False
+            self._last[reading["device_id"]] = (now, reading)
+            return True
 
 class SensorReader:
+    """
+    Reads JSON lines from one or more serial ports and uploads them to the API.
+
+    `ports` maps each serial port to the device_id its readings belong to and
+    the port's baudrate. A single event loop runs for the lifetime of the
+    reader. Every blocking serial port is read on its own thread and all of
+    them feed one bounded queue, and one
+    keep-alive HTTP client drains the queue and posts the readings to
+    /sensor/batch in groups of up to `batch_size` readings or every
+    `flush_interval` seconds, so slow uploads never stall the serial line.
+
+    An optional DeadbandFilter drops readings that did not change enough
+    since the last one sent for the same device.
+
+    Batches that cannot be delivered are written to a ReadingSpool and
+    replayed with exponential backoff once the API is reachable again. Every
+    reading carries a reading_id, so a replay of a batch the server already
+    stored is de-duplicated.
+    """
+
+    def __init__(
+        self,
+        ports,
+        api_url=FASTAPI_URL,
+        batch_size=50,
+        flush_interval=1.0,
+        queue_size=1000,
+        spool_path=SPOOL_PATH,
+        spool_max_rows=500_000,
+        max_backoff=300.0,
+        deadband=None,
+    ):
+        # Ensure the UUIDs are stringified for JSON serialization
+        self.ports = {
+            comport: {"device_id": str(uuid.UUID(str(port["device_id"]))), "baudrate": port.get("baudrate", DEFAULT_BAUDRATE)}
+            for comport, port in ports.items()
+        }
+        self.batch_url = api_url.rstrip("/") + "/batch"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.spool_path = spool_path
+        self.spool_max_rows = spool_max_rows
+        self.max_backoff = max_backoff
+        self.deadband = deadband
+        self._stopping = threading.Event()
+
     @classmethod
-    def read_serial(cls, comport, baudrate):
-        ser = serial.Serial(comport, baudrate, timeout=0.1)
-        while True:
-            data = ser.readline().decode().strip()
-            if data:
-                try:
-                    # Parse JSON data
-                    parsed_data = json.loads(data)
-                    print(f'Received data: {parsed_data}')
-                    # Schedule the store_data function as an async task
-                    asyncio.run(cls.store_data(parsed_data))
-                except json.JSONDecodeError:
-                    print(f"Invalid data format: {data}")
+    def read_serial(cls, comport, baudrate, device_id=DEVICE_ID, **options):
+        asyncio.run(cls({comport: {"device_id": device_id, "baudrate": baudrate}}, **options).run())
+
+    @classmethod
+    def read_ports(cls, ports, **options):
+        asyncio.run(cls(ports, **options).run())
 
     @staticmethod
-    async def store_data(parsed_data):
-        async with httpx.AsyncClient() as client:
-            # Convert device_id to a UUID if necessary and ensure it's a string for JSON
-            device_id = "d484db62-5506-496d-b70c-f6a2d1f3eb7c"  # Replace with actual device ID
+    def to_reading(parsed_data, device_id):
+        # Extract sensor data from the parsed JSON and stamp it with the gateway time
+        return {
+            "reading_id": str(uuid.uuid4()),
+            "device_id": device_id,
+            "mq5_level": parsed_data.get("gas_value"),
+            "motion_status": parsed_data.get("motion_detected"),
+            "temperature": parsed_data.get("temperature_dht"),
+            "humidity": parsed_data.get("humidity"),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+        }
+
+    async def run(self):
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._spooled = asyncio.Event()
+        self.spool = ReadingSpool(self.spool_path, self.spool_max_rows)
+        if len(self.spool):
+            print(f"Replaying {len(self.spool)} spooled readings.")
+            self._spooled.set()
+        loop = asyncio.get_running_loop()
+
+        async with httpx.AsyncClient(timeout=10.0) as client:
+            uploader = asyncio.create_task(self._upload(client))
+            replayer = asyncio.create_task(self._replay(client))
+            # One dedicated thread per port, so a slow or silent port never delays the others
+            executor = ThreadPoolExecutor(max_workers=len(self.ports), thread_name_prefix="serial")
             try:
-                device_id = str(uuid.UUID(device_id))  # Ensure the UUID is stringified for JSON serialization
-            except ValueError:
-                print(f"Invalid UUID format for device_id: {device_id}")
+                await asyncio.gather(*(
+                    loop.run_in_executor(executor, self._read_port, comport, port["baudrate"], port["device_id"], loop)
+                    for comport, port in self.ports.items()
+                ))
+            finally:
+                self._stopping.set()
+                # Let the uploader send or spool whatever is still queued
+                await self._queue.join()
+                uploader.cancel()
+                replayer.cancel()
+                executor.shutdown(wait=False)
+                self.spool.close()
+
+    def stop(self):
+        self._stopping.set()
+
+    def _read_port(self, comport, baudrate, device_id, loop):
+        while not self._stopping.is_set():
+            try:
+                ser = serial.Serial(comport, baudrate, timeout=0.1)
+            except serial.SerialException as e:
+                # Keep the other ports running and try this one again shortly
+                print(f"Cannot open {comport}: {e}")
+                self._stopping.wait(5.0)
+                continue
+            try:
+                self._read_lines(ser, comport, device_id, loop)
+            except serial.SerialException as e:
+                print(f"Lost {comport}: {e}")
+            finally:
+                ser.close()
+
+    def _read_lines(self, ser, comport, device_id, loop):
+        while not self._stopping.is_set():
+            data = ser.readline().decode(errors="replace").strip()
+            if not data:
+                continue
+            try:
+                # Parse JSON data
+                parsed_data = json.loads(data)
+            except json.JSONDecodeError:
+                print(f"Invalid data format on {comport}: {data}")
+                continue
+            reading = self.to_reading(parsed_data, device_id)
+            if self.deadband is not None and not self.deadband.should_send(reading):
+                continue
+            self._enqueue(reading, loop)
+
+    def _enqueue(self, reading, loop):
+        # Blocks this thread while the queue is full instead of growing without bound
+        future = asyncio.run_coroutine_threadsafe(self._queue.put(reading), loop)
+        while True:
+            try:
+                future.result(timeout=PUT_TIMEOUT)
                 return
+            except FutureTimeoutError:
+                if not self._stopping.is_set():
+                    continue
+            # Stopping with the uploader still behind: spool the reading instead of waiting for room. If the
+            # put went through meanwhile it is sent twice, and the API drops the copy by its reading_id.
+            future.cancel()
+            loop.call_soon_threadsafe(self._spool_readings, [reading])
+            return
+
+    def _spool_readings(self, readings):
+        # Runs on the event loop, which owns the spool's connection; run() only closes the spool after
+        # every serial thread has returned, so this is always called before that
+        self.spool.append(readings)
+        self._spooled.set()
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _upload(self, client):
+        while True:
+            batch = await self._next_batch()
+            try:
+                # Keep the order of readings: while anything is spooled, new readings queue behind it
+                if len(self.spool) or await self.send_batch(client, batch) == RETRY:
+                    self.spool.append(batch)
+                    self._spooled.set()
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _replay(self, client):
+        backoff = 1.0
+        while True:
+            await self._spooled.wait()
+            ids, batch = self.spool.peek(self.batch_size)
+            if not ids:
+                self._spooled.clear()
+                continue
+
+            if await self.send_batch(client, batch) == RETRY:
+                # Exponential backoff with jitter while the API is unreachable
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
 
-            # Extract sensor data from the parsed JSON
-            sensor_data = {
-                "device_id": device_id,
-                "mq5_level": parsed_data.get("gas_value"),
-                "motion_status": parsed_data.get("motion_detected"),
-                "temperature": parsed_data.get("temperature_dht"),
-                "humidity": parsed_data.get("humidity")
-            }
+            backoff = 1.0
+            self.spool.ack(ids)
 
+    async def send_batch(self, client, batch):
+        """
+        Posts one batch, honouring Retry-After when the API rate limits the
+        device. Returns SENT, RETRY for failures worth retrying later, or
+        REJECTED when the API refused the batch itself.
+        """
+        while True:
             try:
-                response = await client.post(FASTAPI_URL, json=sensor_data)
+                response = await client.post(self.batch_url, json=batch)
+            except httpx.HTTPError as e:
+                print(f"HTTP error occurred: {e}")
+                return RETRY
+
+            if response.status_code == 429:
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+                continue
+            if response.status_code == 200:
+                result = response.json()
+                print(f"Stored {result['accepted']} readings, {result['rejected']} rejected.")
+                return SENT
+            print(f"Failed to store data: {response.status_code}, {response.text}")
+            return RETRY if response.status_code >= 500 else REJECTED
+
+    @staticmethod
+    async def store_data(parsed_data, device_id=DEVICE_ID, api_url=FASTAPI_URL):
+        # One-off upload of a single reading; long running readers should use run()
+        async with httpx.AsyncClient() as client:
+            sensor_data = SensorReader.to_reading(parsed_data, str(uuid.UUID(str(device_id))))
+            try:
+                response = await client.post(api_url, json=sensor_data)
                 if response.status_code == 201:
                     print("Data stored successfully.")
                 else:
                     print(f"Failed to store data: {response.status_code}, {response.text}")
             except httpx.HTTPError as e:
                 print(f"HTTP error occurred: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Forward serial sensor readings to the esmart API.")
+    parser.add_argument("comport", nargs="?", help="Single port to read; use --config for several")
+    parser.add_argument("--baudrate", type=int, default=DEFAULT_BAUDRATE)
+    parser.add_argument("--device-id", default=DEVICE_ID)
+    parser.add_argument("--config", help="JSON file mapping serial ports to device ids")
+    parser.add_argument("--url", default=FASTAPI_URL)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--flush-interval", type=float, default=1.0)
+    parser.add_argument("--spool", default=SPOOL_PATH, help="SQLite file buffering readings while the API is down")
+    parser.add_argument("--spool-max-rows", type=int, default=500_000)
+    parser.add_argument("--deadband", help="Send only changed readings, e.g. temperature=0.5,humidity=2,mq5_level=10")
+    parser.add_argument("--heartbeat", type=float, default=60.0, help="Maximum seconds between readings with --deadband")
+    args = parser.parse_args()
+
+    deadband = None
+    if args.deadband:
+        deadbands = dict(item.split("=", 1) for item in args.deadband.split(","))
+        deadband = DeadbandFilter(deadbands, heartbeat=args.heartbeat)
+
+    if args.config:
+        ports = load_port_config(args.config)
+    elif args.comport:
+        ports = {args.comport: {"device_id": args.device_id, "baudrate": args.baudrate}}
+    else:
+        parser.error("either a comport or --config is required")
+
+    try:
+        SensorReader.read_ports(
+            ports, api_url=args.url,
+            batch_size=args.batch_size, flush_interval=args.flush_interval,
+            spool_path=args.spool, spool_max_rows=args.spool_max_rows, deadband=deadband,
+        )
+    except KeyboardInterrupt:
+        pass
@@ -13,7 +13,7 @@ from sqlalchemy.exc import NoResultFound, IntegrityError,SQLAlchemyError
 from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy import func
 from sqlalchemy.future import select
-from sqlalchemy import delete
+from sqlalchemy import delete, insert
 from fastapi import Depends, HTTPException, status, APIRouter,Path,BackgroundTasks, WebSocket,Response
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from fastapi.responses import RedirectResponse
@@ -28,7 +28,7 @@ import secrets
 import contextlib
 import asyncio
 import json
-from typing import Annotated,Tuple,List,Dict
+from typing import Annotated,Tuple,List,Dict,Literal
 
 # Local Application Imports
 from src.models.model import Base
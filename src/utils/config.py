@@ -30,6 +30,48 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: SecretStr = Field(default=os.getenv("JWT_SECRET_KEY"))
     JWT_REFRESH_SECRET_KEY: SecretStr = Field(default=os.getenv("JWT_REFRESH_SECRET_KEY"))
 
+    # Sensor ingest settings
+    SENSOR_BATCH_MAX_ITEMS: int = Field(default=int(os.getenv("SENSOR_BATCH_MAX_ITEMS", 1000)))
+    # Opt-in: with the buffer, POST /sensor/ answers 201 once a reading is queued rather than stored
+    INGEST_BUFFER_ENABLED: bool = Field(default=os.getenv("INGEST_BUFFER_ENABLED", "False").lower() == "true")
+    INGEST_FLUSH_MAX_ROWS: int = Field(default=int(os.getenv("INGEST_FLUSH_MAX_ROWS", 500)))
+    INGEST_FLUSH_INTERVAL: float = Field(default=float(os.getenv("INGEST_FLUSH_INTERVAL", 0.25)))  # seconds
+    INGEST_MAX_QUEUE_DEPTH: int = Field(default=int(os.getenv("INGEST_MAX_QUEUE_DEPTH", 10000)))
+    INGEST_ENQUEUE_TIMEOUT: float = Field(default=float(os.getenv("INGEST_ENQUEUE_TIMEOUT", 1.0)))  # seconds
+    SENSOR_DEDUP_WINDOW: int = Field(default=int(os.getenv("SENSOR_DEDUP_WINDOW", 1024)))  # ids kept per device
+    SENSOR_DEDUP_MAX_DEVICES: int = Field(default=int(os.getenv("SENSOR_DEDUP_MAX_DEVICES", 10000)))
+    # Devices that only send changed readings report at least this often; shorter gaps mean "unchanged"
+    SENSOR_HEARTBEAT_SECONDS: int = Field(default=int(os.getenv("SENSOR_HEARTBEAT_SECONDS", 300)))
+    SENSOR_SERIES_MAX_POINTS: int = Field(default=int(os.getenv("SENSOR_SERIES_MAX_POINTS", 10000)))
+    # Maintain 1m/1h/1d rollups on ingest and serve aggregates from them
+    SENSOR_ROLLUPS_ENABLED: bool = Field(default=os.getenv("SENSOR_ROLLUPS_ENABLED", "True").lower() == "true")
+    # Per-device in-memory ring of recent readings for recent history and aggregates
+    SENSOR_RECENT_ENABLED: bool = Field(default=os.getenv("SENSOR_RECENT_ENABLED", "True").lower() == "true")
+    SENSOR_RECENT_WINDOW_SECONDS: int = Field(default=int(os.getenv("SENSOR_RECENT_WINDOW_SECONDS", 86400)))
+    SENSOR_RECENT_MAX_ROWS: int = Field(default=int(os.getenv("SENSOR_RECENT_MAX_ROWS", 86400)))  # per device
+    SENSOR_RECENT_MEMORY_MB: int = Field(default=int(os.getenv("SENSOR_RECENT_MEMORY_MB", 256)))
+    SENSOR_PAGE_DEFAULT_SIZE: int = Field(default=int(os.getenv("SENSOR_PAGE_DEFAULT_SIZE", 100)))
+    SENSOR_PAGE_MAX_SIZE: int = Field(default=int(os.getenv("SENSOR_PAGE_MAX_SIZE", 1000)))
+    # "monthly" stores readings in one sensor_data_YYYY_MM table per month, anything else in sensor_data
+    SENSOR_PARTITIONING: str = Field(default=os.getenv("SENSOR_PARTITIONING", "none"))
+    # Above 1, sensor readings are spread over this many databases by device; fixed once data is stored
+    SENSOR_SHARD_COUNT: int = Field(default=int(os.getenv("SENSOR_SHARD_COUNT", 0)))
+    SENSOR_SHARD_URL: str = Field(default=os.getenv("SENSOR_SHARD_URL", "sqlite:///./sensor_shard_{shard}.db"))
+    SENSOR_RETENTION_DAYS: float = Field(default=float(os.getenv("SENSOR_RETENTION_DAYS", 0)))  # raw readings, 0 keeps forever
+    # JSON object mapping device ids to retention days, e.g. {"<device_id>": 90}
+    SENSOR_RETENTION_OVERRIDES: str = Field(default=os.getenv("SENSOR_RETENTION_OVERRIDES", "{}"))
+    # JSON object mapping rollup resolutions in seconds to retention days, e.g. {"60": 90, "3600": 730}
+    SENSOR_ROLLUP_RETENTION_DAYS: str = Field(default=os.getenv("SENSOR_ROLLUP_RETENTION_DAYS", "{}"))
+    SENSOR_RETENTION_INTERVAL: float = Field(default=float(os.getenv("SENSOR_RETENTION_INTERVAL", 3600)))  # seconds
+    SENSOR_PURGE_CHUNK_ROWS: int = Field(default=int(os.getenv("SENSOR_PURGE_CHUNK_ROWS", 1000)))
+    SENSOR_PURGE_PAUSE: float = Field(default=float(os.getenv("SENSOR_PURGE_PAUSE", 0.1)))  # seconds between chunks
+    SENSOR_VACUUM_PAGES: int = Field(default=int(os.getenv("SENSOR_VACUUM_PAGES", 1000)))  # per incremental vacuum step
+    SENSOR_VACUUM_MAX_PASSES: int = Field(default=int(os.getenv("SENSOR_VACUUM_MAX_PASSES", 100)))  # steps per retention run
+    SENSOR_RATE_LIMIT: float = Field(default=float(os.getenv("SENSOR_RATE_LIMIT", 20)))  # readings/s per device, 0 disables
+    SENSOR_RATE_BURST: float = Field(default=float(os.getenv("SENSOR_RATE_BURST", 200)))
+    # JSON object keyed by device id or "model:<device model>", e.g. {"model:MQ5-GW": {"rate": 50, "burst": 500}}
+    SENSOR_RATE_LIMIT_OVERRIDES: str = Field(default=os.getenv("SENSOR_RATE_LIMIT_OVERRIDES", "{}"))
+
     # Optional settings
     DEBUG: bool = Field(default=os.getenv("DEBUG", "False").lower() == "true")
 
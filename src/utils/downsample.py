@@ -0,0 +1,45 @@
+# downsample.py
+"""
+Largest-Triangle-Three-Buckets downsampling for chart series.
+
+Keeps the first and last points and, from every bucket in between, the
+point that forms the largest triangle with the point kept from the
+previous bucket and the average of the next bucket. The result keeps
+peaks and troughs that plain decimation or averaging would flatten.
+"""
+import numpy as np
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Returns the indices of the `n_out` points to keep from the series
+    (x, y), where x is sorted ascending and contains no NaN.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1][:n_out], dtype=np.int64)
+
+    # Bucket boundaries over the points between the first and the last
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of every bucket, used as the third triangle vertex for the bucket before it
+    x_sum = np.add.reduceat(x[1:n - 1], starts - 1)
+    y_sum = np.add.reduceat(y[1:n - 1], starts - 1)
+    sizes = ends - starts
+    next_x = np.append(x_sum[1:] / sizes[1:], x[-1])
+    next_y = np.append(y_sum[1:] / sizes[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    prev_x, prev_y = x[0], y[0]
+    # Each bucket depends on the point picked in the previous one; the areas inside a bucket are vectorized
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        bx, by = x[start:end], y[start:end]
+        area = np.abs((prev_x - next_x[i]) * (by - prev_y) - (prev_x - bx) * (next_y[i] - prev_y))
+        chosen = start + int(np.argmax(area))
+        keep[i + 1] = chosen
+        prev_x, prev_y = x[chosen], y[chosen]
+    return keep
@@ -0,0 +1,62 @@
+# queryplan.py
+"""
+Checks that the per-device sensor history queries are served by an index.
+
+Builds the sensor_data schema and a monthly partition in an in-memory SQLite database, runs
+EXPLAIN QUERY PLAN on the queries the sensor endpoints issue and fails when
+any of them scans the whole table or sorts in a temporary b-tree.
+
+Usage:
+    python -m src.utils.queryplan
+"""
+import sys
+from datetime import datetime, timedelta
+from uuid import uuid4
+
+from sqlalchemy import create_engine
+
+from src.models.model import Base
+from src.crud import sensordata
+from src.services.partitions import sensor_partitions
+
+
+def _plans():
+    device_id = uuid4()
+    end = datetime(2024, 1, 2)
+    start = end - timedelta(days=1)
+    # Monthly partitions get the same queries with the partition in place of sensor_data
+    partition = sensor_partitions.entity(datetime(2024, 1, 1))
+    return {
+        "history": sensordata.device_history_query(device_id).limit(101),
+        "history range": sensordata.device_history_query(device_id, start, end).limit(101),
+        "history cursor": sensordata.device_history_query(device_id, start, end, (start, uuid4())).limit(101),
+        "history newest": sensordata.device_history_query(device_id, descending=True).limit(101),
+        "history newest cursor": sensordata.device_history_query(device_id, after=(end, uuid4()), descending=True).limit(101),
+        "series seed": sensordata.series_seed_query(device_id, start),
+        "series range": sensordata.series_range_query(device_id, start, end),
+        "partition history cursor": sensordata.device_history_query(device_id, start, end, (start, uuid4()), data=partition).limit(101),
+        "partition history newest": sensordata.device_history_query(device_id, descending=True, data=partition).limit(101),
+        "partition series seed": sensordata.series_seed_query(device_id, start, partition),
+    }
+
+
+def check() -> list:
+    """Returns (name, plan) pairs for every query whose plan is not index-only ordered."""
+    plans = _plans()  # registers the partition table before the schema is built
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    failures = []
+    with engine.connect() as conn:
+        for name, query in plans.items():
+            sql = str(query.compile(engine, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+            bad = [step for step in plan if step.startswith("SCAN sensor_data") or "TEMP B-TREE" in step]
+            print(f"{'FAIL' if bad else 'ok  '} {name}: {'; '.join(plan)}")
+            if bad:
+                failures.append((name, plan))
+    engine.dispose()
+    return failures
+
+
+if __name__ == "__main__":
+    sys.exit(1 if check() else 0)
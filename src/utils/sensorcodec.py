@@ -0,0 +1,130 @@
+# sensorcodec.py
+"""
+Compact binary record format for sensor readings.
+
+Every reading is a fixed 37 byte little-endian record:
+
+    offset  size  field           type     null value
+    0       16    device_id       uuid     all zero bytes
+    16      8     timestamp       int64    0 (ms since the Unix epoch, UTC)
+    24      4     mq5_level       int32    INT32_MIN
+    28      1     motion_status   uint8    0xFF
+    29      4     temperature     float32  NaN
+    33      4     humidity        int32    INT32_MIN
+
+A payload is one record or a packed array of records with no header or
+padding, so it can be decoded in bulk with a single numpy.frombuffer call.
+"""
+import struct
+from datetime import timezone
+from typing import Iterable, List, Union
+from uuid import UUID
+
+import numpy as np
+
+from src.schemas import schemas
+
+CONTENT_TYPE = "application/vnd.esmart.sensor-record"
+
+RECORD_STRUCT = struct.Struct("<16sqiBfi")
+RECORD_SIZE = RECORD_STRUCT.size
+
+RECORD_DTYPE = np.dtype([
+    ("device_id", "V16"),
+    ("timestamp", "<i8"),
+    ("mq5_level", "<i4"),
+    ("motion_status", "u1"),
+    ("temperature", "<f4"),
+    ("humidity", "<i4"),
+])
+
+INT_NULL = np.iinfo(np.int32).min
+MOTION_NULL = 0xFF
+NULL_DEVICE = bytes(16)
+# Timestamps must convert to a Python datetime, so they end before the year 10000
+MAX_TIMESTAMP = int(np.datetime64("10000-01-01", "ms").astype(np.int64))
+
+
+def encode_records(readings: Iterable[Union[schemas.SensorDataCreate, dict]]) -> bytes:
+    """
+    Packs readings into the binary record format. Readings without a
+    recorded_at timestamp are sent with 0 so the server assigns its own time.
+    """
+    chunks = []
+    for reading in readings:
+        if isinstance(reading, dict):
+            reading = schemas.SensorDataCreate.model_validate(reading)
+
+        timestamp = 0
+        if reading.recorded_at is not None:
+            recorded_at = reading.recorded_at
+            if recorded_at.tzinfo is None:
+                recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+            timestamp = int(recorded_at.timestamp() * 1000)
+
+        chunks.append(RECORD_STRUCT.pack(
+            reading.device_id.bytes if reading.device_id else NULL_DEVICE,
+            timestamp,
+            INT_NULL if reading.mq5_level is None else reading.mq5_level,
+            MOTION_NULL if reading.motion_status is None else reading.motion_status,
+            float("nan") if reading.temperature is None else reading.temperature,
+            INT_NULL if reading.humidity is None else reading.humidity,
+        ))
+    return b"".join(chunks)
+
+
+def decode_records(payload: bytes) -> List[schemas.SensorDataCreate]:
+    """
+    Decodes a packed array of records into SensorDataCreate objects.
+
+    The fixed layout already guarantees the field types, so the objects are
+    built with model_construct and skip per-reading Pydantic validation; the
+    value ranges are checked for all records at once instead. Raises
+    ValueError if the payload is not a whole number of records or a record
+    has a timestamp outside 1970-9999 or an infinite temperature.
+    """
+    if len(payload) % RECORD_SIZE:
+        raise ValueError(f"Payload size must be a multiple of {RECORD_SIZE} bytes")
+
+    records = np.frombuffer(payload, dtype=RECORD_DTYPE)
+    if not len(records):
+        return []
+
+    timestamps = records["timestamp"]
+    for invalid, message in (
+        ((timestamps < 0) | (timestamps >= MAX_TIMESTAMP), "timestamp is out of range"),
+        (np.isinf(records["temperature"]), "temperature must be finite"),
+    ):
+        if invalid.any():
+            raise ValueError(f"Record {int(np.argmax(invalid))}: {message}")
+
+    # Convert every column in bulk and only fall back to Python for the nulls
+    recorded_at = timestamps.astype("datetime64[ms]").tolist()
+    missing_timestamp = (timestamps == 0).tolist()
+    mq5_level = records["mq5_level"].tolist()
+    mq5_missing = (records["mq5_level"] == INT_NULL).tolist()
+    motion_status = records["motion_status"].tolist()
+    motion_missing = (records["motion_status"] == MOTION_NULL).tolist()
+    temperature = np.round(records["temperature"].astype(np.float64), 2).tolist()
+    temperature_missing = np.isnan(records["temperature"]).tolist()
+    humidity = records["humidity"].tolist()
+    humidity_missing = (records["humidity"] == INT_NULL).tolist()
+
+    # Most payloads come from a handful of devices, so parse each UUID once
+    device_ids = {}
+    readings = []
+    for i, raw_device in enumerate(records["device_id"].tolist()):
+        device_id = device_ids.get(raw_device)
+        if device_id is None and raw_device not in device_ids:
+            device_id = UUID(bytes=raw_device) if raw_device != NULL_DEVICE else None
+            device_ids[raw_device] = device_id
+
+        readings.append(schemas.SensorDataCreate.model_construct(
+            device_id=device_id,
+            mq5_level=None if mq5_missing[i] else mq5_level[i],
+            motion_status=None if motion_missing[i] else motion_status[i],
+            temperature=None if temperature_missing[i] else temperature[i],
+            humidity=None if humidity_missing[i] else humidity[i],
+            recorded_at=None if missing_timestamp[i] else recorded_at[i],
+        ))
+    return readings
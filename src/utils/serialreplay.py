@@ -0,0 +1,204 @@
+# serialreplay.py
+"""
+Records raw serial traffic and replays it against the API as a load generator.
+
+Recordings are text files with one "<seconds since start>\\t<raw line>" entry
+per serial line. Replaying turns every line into a reading with
+SensorReader.to_reading and posts it, one stream per recording and device,
+either in real time, sped up, or as fast as possible. With --binary the
+readings are packed as sensorcodec records and posted to /sensor/batch/binary.
+
+Usage:
+    python -m src.utils.serialreplay record COM3 kitchen.rec --duration 3600
+    python -m src.utils.serialreplay replay kitchen.rec --device-id <uuid> --speed 10 \\
+        --url http://127.0.0.1:8000/sensor/
+    python -m src.utils.serialreplay replay kitchen.rec hall.rec --device-id <uuid> --device-id <uuid> \\
+        --speed max --asgi
+    python -m src.utils.serialreplay replay kitchen.rec --device-id <uuid> --speed max --batch-size 500 --binary
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+import serial
+from pydantic import ValidationError
+
+from src.utils import sensorcodec
+from src.utils.Sensorreader import SensorReader, FASTAPI_URL, DEFAULT_BAUDRATE
+
+
+def record(comport, path, baudrate=DEFAULT_BAUDRATE, duration=None):
+    """Writes every serial line with its arrival time until `duration` seconds pass or Ctrl+C."""
+    ser = serial.Serial(comport, baudrate, timeout=0.1)
+    started = time.monotonic()
+    lines = 0
+    try:
+        with open(path, "w") as f:
+            while duration is None or time.monotonic() - started < duration:
+                data = ser.readline().decode(errors="replace").strip()
+                if data:
+                    f.write(f"{time.monotonic() - started:.6f}\t{data}\n")
+                    lines += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ser.close()
+    print(f"Recorded {lines} lines to {path}")
+
+
+def load_recording(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            offset, _, data = line.rstrip("\n").partition("\t")
+            entries.append((float(offset), data))
+    return entries
+
+
+class ReplayStats:
+    def __init__(self):
+        self.latencies = []
+        self.readings = 0
+        self.errors = Counter()
+
+    def report(self, elapsed):
+        latencies = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99]).tolist() if len(latencies) else (0.0, 0.0, 0.0)
+        return {
+            "readings": self.readings,
+            "requests": len(self.latencies),
+            "elapsed_s": round(elapsed, 3),
+            "readings_per_s": round(self.readings / elapsed, 1) if elapsed else 0.0,
+            "latency_ms": {"p50": round(p50, 2), "p95": round(p95, 2), "p99": round(p99, 2)},
+            "errors": dict(self.errors),
+        }
+
+
+async def _replay_stream(client, url, entries, device_id, speed, batch_size, stats, started, binary=False):
+    batch = []
+
+    async def send():
+        sent = time.perf_counter()
+        try:
+            if binary:
+                response = await client.post(
+                    url + "batch/binary", content=b"".join(batch), headers={"Content-Type": sensorcodec.CONTENT_TYPE})
+            elif batch_size > 1:
+                response = await client.post(url + "batch", json=batch)
+            else:
+                response = await client.post(url, json=batch[0])
+            if response.status_code >= 400:
+                stats.errors[str(response.status_code)] += 1
+            elif binary or batch_size > 1:
+                # The batch endpoint answers 200 with per-item results, so only count what it accepted
+                result = response.json()
+                stats.readings += result["accepted"]
+                for item in result["results"]:
+                    if not item["accepted"]:
+                        stats.errors[item["error"] or "rejected"] += 1
+            else:
+                stats.readings += 1
+        except httpx.HTTPError as e:
+            stats.errors[type(e).__name__] += 1
+        stats.latencies.append(time.perf_counter() - sent)
+        batch.clear()
+
+    for offset, data in entries:
+        if speed:
+            delay = started + offset / speed - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        try:
+            parsed_data = json.loads(data)
+        except json.JSONDecodeError:
+            stats.errors["invalid_line"] += 1
+            continue
+        reading = SensorReader.to_reading(parsed_data, device_id)
+        if binary:
+            try:
+                reading = sensorcodec.encode_records([reading])
+            except ValidationError:
+                stats.errors["invalid_reading"] += 1
+                continue
+        batch.append(reading)
+        if len(batch) >= batch_size:
+            await send()
+    if batch:
+        await send()
+
+
+async def replay(paths, device_ids, url=FASTAPI_URL, speed=1.0, batch_size=1, app=None, binary=False):
+    """
+    Replays every recording once per device id concurrently. `speed` is the
+    time multiplier, or 0 to send as fast as the API accepts. Pass an ASGI
+    `app` to drive it in-process instead of over the network, and `binary` to
+    post packed sensorcodec records instead of JSON.
+    """
+    recordings = [load_recording(path) for path in paths]
+    stats = ReplayStats()
+    url = url.rstrip("/") + "/"
+
+    if app is not None:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay")
+        url = httpx.URL(url).path
+    else:
+        client = httpx.AsyncClient(timeout=30.0, limits=httpx.Limits(max_connections=len(device_ids)))
+
+    async with client:
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            _replay_stream(
+                client, url, recordings[i % len(recordings)], device_id, speed, batch_size, stats, started, binary)
+            for i, device_id in enumerate(device_ids)
+        ))
+        elapsed = time.perf_counter() - started
+    return stats.report(elapsed)
+
+
+async def _replay_in_process(args, device_ids, speed):
+    from main import app
+
+    # Run the app's startup and shutdown so the ingest buffer is active and drained
+    async with app.router.lifespan_context(app):
+        return await replay(args.recordings, device_ids, args.url, speed, args.batch_size, app=app, binary=args.binary)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record serial traffic or replay recordings against the API.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="Record raw serial lines with timestamps")
+    record_parser.add_argument("comport")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--baudrate", type=int, default=DEFAULT_BAUDRATE)
+    record_parser.add_argument("--duration", type=float, help="Seconds to record, default until Ctrl+C")
+
+    replay_parser = commands.add_parser("replay", help="Replay recordings and report throughput and latency")
+    replay_parser.add_argument("recordings", nargs="+")
+    replay_parser.add_argument("--device-id", action="append", required=True,
+                               help="Device to replay as; repeat to simulate several devices")
+    replay_parser.add_argument("--speed", default="1", help="Time multiplier such as 1 or 10, or 'max'")
+    replay_parser.add_argument("--batch-size", type=int, default=1, help="Readings per request, 1 posts to /sensor/")
+    replay_parser.add_argument("--url", default=FASTAPI_URL)
+    replay_parser.add_argument("--asgi", action="store_true", help="Drive the app in-process instead of over HTTP")
+    replay_parser.add_argument("--binary", action="store_true", help="Post packed binary records to /sensor/batch/binary")
+
+    args = parser.parse_args()
+    if args.command == "record":
+        record(args.comport, args.path, args.baudrate, args.duration)
+        return
+
+    speed = 0.0 if args.speed == "max" else float(args.speed)
+    if args.asgi:
+        report = asyncio.run(_replay_in_process(args, args.device_id, speed))
+    else:
+        report = asyncio.run(replay(args.recordings, args.device_id, args.url, speed, args.batch_size, binary=args.binary))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()